@@ -0,0 +1,512 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+from collections import Counter
+from datetime import datetime, timezone
+
+from columnar import COLUMNAR_EXTENSIONS, export_columnar
+from sinks import PRODUCT_FIELDNAMES, csv_row, json_array_item, load_nested, to_int
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    product_key TEXT PRIMARY KEY,
+    product_url TEXT UNIQUE,
+    product_sku TEXT,
+    product_id INTEGER,
+    product_name TEXT,
+    price INTEGER,
+    special_price INTEGER,
+    description TEXT,
+    short_description TEXT,
+    product_type TEXT,
+    category_ids INTEGER NOT NULL DEFAULT 0,
+    attribute_count INTEGER,
+    variation_matrix TEXT,
+    first_crawled_at TEXT NOT NULL,
+    crawled_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_sku ON products (product_sku);
+CREATE INDEX IF NOT EXISTS products_crawled_at ON products (crawled_at);
+
+CREATE TABLE IF NOT EXISTS categories (
+    product_key TEXT NOT NULL REFERENCES products ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    category,
+    PRIMARY KEY (product_key, position)
+);
+CREATE INDEX IF NOT EXISTS categories_category ON categories (category);
+
+CREATE TABLE IF NOT EXISTS variations (
+    product_key TEXT NOT NULL REFERENCES products ON DELETE CASCADE,
+    attribute_position INTEGER NOT NULL,
+    option_position INTEGER NOT NULL,
+    attribute_name TEXT,
+    attribute_code TEXT,
+    option_code TEXT,
+    option_price INTEGER,
+    PRIMARY KEY (product_key, attribute_position, option_position)
+);
+
+CREATE TABLE IF NOT EXISTS images (
+    product_key TEXT NOT NULL REFERENCES products ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    image_url TEXT NOT NULL,
+    PRIMARY KEY (product_key, position)
+);
+CREATE INDEX IF NOT EXISTS images_image_url ON images (image_url);
+"""
+
+PRODUCT_COLUMNS = ['product_key', 'product_url', 'product_sku', 'product_id', 'product_name', 'price', 'special_price', 'description', 'short_description', 'product_type', 'category_ids', 'attribute_count', 'variation_matrix', 'first_crawled_at', 'crawled_at']
+
+# Columns that keep their value from the first time a product was stored
+KEPT_COLUMNS = {'product_key', 'first_crawled_at'}
+
+UPSERT_PRODUCT = f"""
+INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}) VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})
+ON CONFLICT (product_key) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in PRODUCT_COLUMNS if column not in KEPT_COLUMNS)}
+"""
+
+# Columns a lookup or refresh may patch in place
+PATCHABLE_COLUMNS = {'product_name', 'price', 'special_price', 'description', 'short_description', 'product_type'}
+
+CATALOG_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+
+def utc_timestamp(timestamp=None):
+    """An ISO 8601 UTC timestamp, they sort in time order as text."""
+    moment = datetime.fromtimestamp(timestamp, timezone.utc) if timestamp is not None else datetime.now(timezone.utc)
+    return moment.isoformat(timespec='seconds')
+
+
+def product_key(product, product_url=None, shared_keys=()):
+    """The key of a product in the catalog: its URL, else its SKU, else its name.
+
+    The crawlers before v4.2 wrote neither a URL nor a SKU, only a name.
+    Generated SKUs aren't unique (two products with the same name share
+    one): a SKU or name in `shared_keys`, held by several records of the
+    file being imported, gets the product ID added. Product IDs are listing
+    positions, so those products are added again by each import instead of
+    merged.
+    """
+    product_url = product_url or product.get('product_url')
+    if product_url:
+        return product_url
+    if product.get('product_sku'):
+        key = f"sku:{product['product_sku']}"
+    elif product.get('product_name'):
+        key = f"name:{product['product_name']}"
+    else:
+        raise ValueError(f"Product {product.get('product_id')} has no URL, SKU or name to be stored by")
+    return f"{key}/{product.get('product_id')}" if key in shared_keys else key
+
+
+def legacy_record(record, row_number):
+    """A record of an older crawler (products_v2 to v4.2) in the current layout.
+
+    Their prices are the displayed text: 'regular sale' for products on
+    sale and 'min – max' for price ranges. v2 splits them into
+    original_price and sale_price. Rows without a product ID get their row
+    number.
+    """
+    record = dict(record)
+    if not record.get('product_id'):
+        record['product_id'] = row_number
+    if not str(record.get('price') or '').strip() and record.get('original_price'):
+        record['price'] = record['original_price']
+        record.setdefault('special_price', record.get('sale_price') or 0)
+
+    price = record.get('price')
+    if isinstance(price, str):
+        prices = re.findall(r'\d[\d.,]*', price)
+        if len(prices) == 2 and '–' not in price and not record.get('special_price'):
+            record['special_price'] = prices[1]
+    return record
+
+
+def variation_options(attribute):
+    """(attribute name, attribute code, [(option code, price)]) of a variations item.
+
+    Items of the crawlers before v5 are a single {'variation_code',
+    'variation_price'} option without an attribute, they are kept as an
+    option of a nameless attribute.
+    """
+    if 'options' in attribute:
+        return attribute['attribute_name'], attribute['attribute_code'], [(option['attribute_option_code'], option['attribute_option_price']) for option in attribute['options']]
+    if 'variation_code' in attribute:
+        return None, None, [(attribute['variation_code'], attribute.get('variation_price'))]
+    raise ValueError(f"Unknown variations item {attribute!r}")
+
+
+def check_record(record):
+    """Raise ValueError if a record can't be stored, before anything of its file is written."""
+    product_key(record)
+    variations = load_nested(record.get('variations'))
+    if variations is not None and not isinstance(variations, list):
+        raise ValueError(f"variations isn't a list: {variations!r:.80}")
+    for attribute in variations or []:
+        variation_options(attribute)
+
+
+def iter_dataset(path):
+    """Yield the records of a products CSV, JSON Lines or JSON file."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'r', newline='', encoding='utf-8') as dataset_file:
+        if extension == '.csv':
+            csv.field_size_limit(2 ** 31 - 1)
+            yield from csv.DictReader(dataset_file)
+        elif extension == '.jsonl':
+            yield from (json.loads(line) for line in dataset_file if line.strip())
+        else:
+            yield from json.load(dataset_file)
+
+
+class ProductRows:
+    """Rows of a table ordered like the products they belong to, handed out one product at a time."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.head = next(cursor, None)
+
+    def take(self, product_key):
+        """The rows of `product_key`, which has to be the next product with rows or one without any."""
+        rows = []
+        while self.head is not None and self.head[0] == product_key:
+            rows.append(self.head[1:])
+            self.head = next(self.cursor, None)
+        return rows
+
+
+class AmbiguousSku(Exception):
+    """A SKU without a product URL match is shared by several products, none of them can be patched."""
+
+
+class CatalogStore:
+    """Products of every crawl in one SQLite database, keyed by product URL and SKU.
+
+    Products, their categories, variation options and images each get a
+    table, indexed on SKU, category, image URL and crawl time. Records are
+    upserted in batches of `batch_size`, one transaction each; the time a
+    product was first and last crawled is kept. The products.csv,
+    products.jsonl and products.json layouts are exported from it.
+
+    It can be given to a crawl as an output like a RecordSink: it has the
+    same write(), flush() and close().
+    """
+
+    def __init__(self, path='catalog.db', batch_size=200):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.written = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+    # Writing
+
+    def write(self, product, product_url=None, crawled_at=None, key=None):
+        """Queue a product record for the next batched upsert, under `key` or else its product_key."""
+        self.pending.append((key or product_key(product, product_url), product_url or product.get('product_url'), product, crawled_at or utc_timestamp()))
+        self.written += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Upsert the queued records in one transaction."""
+        if not self.pending:
+            return
+        product_rows = []
+        category_rows = []
+        variation_rows = []
+        image_rows = []
+        # A product written twice in a batch is stored as last written
+        batch = {key: (key, product_url, product, crawled_at) for key, product_url, product, crawled_at in self.pending}
+        for key, product_url, product, crawled_at in batch.values():
+            # Category names as crawled, or the category IDs of mapped_products.json
+            category = product.get('category') or ''
+            if isinstance(category, str) and category.startswith('['):
+                category = json.loads(category)
+            category_ids = isinstance(category, list)
+            if not category_ids:
+                category = category.split(', ') if category else []
+            # None for records without a variations list (simple products of a crawl)
+            variations = load_nested(product.get('variations'))
+            variation_matrix = load_nested(product.get('variation_matrix'))
+
+            product_rows.append((
+                key, product_url, product.get('product_sku'), to_int(product.get('product_id')), product.get('product_name'),
+                to_int(product.get('price')), to_int(product.get('special_price')),
+                product.get('description'), product.get('short_description'), product.get('product_type'),
+                int(category_ids), len(variations) if variations is not None else None, json.dumps(variation_matrix, ensure_ascii=False) if variation_matrix else None,
+                crawled_at, crawled_at,
+            ))
+            category_rows.extend((key, position, name) for position, name in enumerate(category))
+            attributes = [variation_options(attribute) for attribute in variations or []]
+            # The option codes of the crawlers before v5 all go to one nameless attribute
+            legacy_options = [option for name, code, options in attributes if name is None and code is None for option in options]
+            attributes = [attribute for attribute in attributes if attribute[0] is not None or attribute[1] is not None]
+            if legacy_options:
+                attributes.append((None, None, legacy_options))
+            for attribute_position, (attribute_name, attribute_code, options) in enumerate(attributes):
+                variation_rows.extend((key, attribute_position, option_position, attribute_name, attribute_code, code, to_int(price))
+                                      for option_position, (code, price) in enumerate(options))
+            if product.get('image_url'):
+                image_rows.append((key, 0, product['image_url']))
+
+        keys = [(key,) for key in batch]
+        with self.connection:
+            self.connection.executemany(UPSERT_PRODUCT, product_rows)
+            for table in ('categories', 'variations', 'images'):
+                self.connection.executemany(f'DELETE FROM {table} WHERE product_key = ?', keys)
+            self.connection.executemany('INSERT INTO categories VALUES (?, ?, ?)', category_rows)
+            self.connection.executemany('INSERT INTO variations VALUES (?, ?, ?, ?, ?, ?, ?)', variation_rows)
+            self.connection.executemany('INSERT INTO images VALUES (?, ?, ?)', image_rows)
+        self.pending = []
+
+    def import_file(self, path):
+        """Merge a products.csv, products.jsonl or products.json (mapped or not) into the catalog.
+
+        The outputs of the older crawlers (products_v2.csv to
+        products_v4.2.csv) are read too, see legacy_record. The whole file
+        is checked before anything is written, a row that can't be stored
+        raises ValueError. Products already stored under the same key (see
+        product_key) are updated in place. Returns the number of records read.
+        """
+        key_counts = Counter()
+        for row_number, record in enumerate(iter_dataset(path), 1):
+            try:
+                record = legacy_record(record, row_number)
+                check_record(record)
+            except (ValueError, TypeError, KeyError) as err:
+                raise ValueError(f"{path} row {row_number} can't be imported, nothing was written: {err}") from err
+            key_counts[product_key(record)] += 1
+        shared_keys = {key for key, count in key_counts.items() if count > 1}
+
+        crawled_at = utc_timestamp(os.path.getmtime(path))
+        count = 0
+        for row_number, record in enumerate(iter_dataset(path), 1):
+            record = legacy_record(record, row_number)
+            self.write(record, crawled_at=crawled_at, key=product_key(record, shared_keys=shared_keys))
+            count += 1
+        self.flush()
+        return count
+
+    def patch(self, product_url, product_sku, updates):
+        """Update columns of the products with `product_url`, or of the product with `product_sku` if none has it.
+
+        Returns (matched, changed) product counts. Raises AmbiguousSku when
+        the SKU is needed but several products have it.
+        """
+        columns = [column for column in updates if column in PATCHABLE_COLUMNS]
+        if not columns:
+            return 0, 0
+        matches = self.connection.execute(f"SELECT product_key, {', '.join(columns)} FROM products WHERE product_url = ?", (product_url,)).fetchall()
+        if not matches and product_sku:
+            matches = self.connection.execute(f"SELECT product_key, {', '.join(columns)} FROM products WHERE product_sku = ?", (product_sku,)).fetchall()
+            if len(matches) > 1:
+                raise AmbiguousSku(product_sku)
+
+        changed = [(*(updates[column] for column in columns), key) for key, *values in matches if list(values) != [updates[column] for column in columns]]
+        if changed:
+            with self.connection:
+                self.connection.executemany(f"UPDATE products SET {', '.join(f'{column} = ?' for column in columns)} WHERE product_key = ?", changed)
+        return len(matches), len(changed)
+
+    # Reading
+
+    def record(self, row, categories, images, variation_rows):
+        """The product record of a products row and its rows of the other tables, in the products.csv field order."""
+        categories = [name for name, in categories]
+        variations = []
+        last_position = None
+        for attribute_position, attribute_name, attribute_code, option_code, option_price in variation_rows:
+            if attribute_name is None and attribute_code is None:
+                variations.append({'variation_code': option_code, 'variation_price': option_price})
+                continue
+            if attribute_position != last_position:
+                variations.append({'attribute_name': attribute_name, 'attribute_code': attribute_code, 'options': []})
+                last_position = attribute_position
+            variations[-1]['options'].append({'attribute_option_code': option_code, 'attribute_option_price': option_price})
+
+        product = {
+            'product_id': row['product_id'],
+            'product_name': row['product_name'],
+            'product_sku': row['product_sku'],
+            'category': categories if row['category_ids'] else ', '.join(categories),
+            'price': row['price'],
+            'special_price': row['special_price'],
+            'description': row['description'],
+            'short_description': row['short_description'],
+            'image_url': images[0][0] if images else '',
+            'product_type': row['product_type'],
+            'variations': variations if row['attribute_count'] is not None else None,
+        }
+        if row['variation_matrix']:
+            product['variation_matrix'] = json.loads(row['variation_matrix'])
+        if row['product_url']:
+            product['product_url'] = row['product_url']
+        return product
+
+    def rows(self, where='1', params=()):
+        """Yield the products rows matching a WHERE clause as dicts, in the order they were first stored."""
+        self.flush()
+        cursor = self.connection.execute(f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products WHERE {where} ORDER BY rowid", params)
+        for values in cursor:
+            yield dict(zip(PRODUCT_COLUMNS, values))
+
+    def product_rows(self, table, columns, order, where, params):
+        """The rows of `table` for the products matching a WHERE clause, in the order of rows()."""
+        cursor = self.connection.execute(
+            f"SELECT product_key, {columns} FROM (SELECT rowid AS product_order, product_key FROM products WHERE {where}) "
+            f"JOIN {table} USING (product_key) ORDER BY product_order, {order}", params)
+        return ProductRows(cursor)
+
+    def records(self, where='1', params=()):
+        """Yield (row, record) of the products matching a WHERE clause, in the order they were first stored.
+
+        Categories, images and variations are read with one query per table
+        in the same order, and handed to each product as the cursors advance.
+        """
+        self.flush()
+        categories = self.product_rows('categories', 'category', 'position', where, params)
+        images = self.product_rows('images', 'image_url', 'position', where, params)
+        variations = self.product_rows('variations', 'attribute_position, attribute_name, attribute_code, option_code, option_price', 'attribute_position, option_position', where, params)
+        for row in self.rows(where, params):
+            key = row['product_key']
+            yield row, self.record(row, categories.take(key), images.take(key), variations.take(key))
+
+    def query(self, where='1', params=()):
+        """Yield the records of the products matching a WHERE clause, in the order they were first stored."""
+        for _, product in self.records(where, params):
+            yield product
+
+    def get(self, product_url):
+        return next(self.query('product_url = ?', (product_url,)), None)
+
+    def find_sku(self, product_sku):
+        return list(self.query('product_sku = ?', (product_sku,)))
+
+    def in_category(self, category):
+        """Products listed under a category name (or mapped category ID)."""
+        return list(self.query('product_key IN (SELECT product_key FROM categories WHERE category = ?)', (category,)))
+
+    def crawled_since(self, timestamp):
+        return list(self.query('crawled_at >= ?', (timestamp,)))
+
+    def not_crawled_since(self, timestamp):
+        """Products a crawl started at `timestamp` didn't see again, e.g. removed from the shop."""
+        return list(self.query('crawled_at < ?', (timestamp,)))
+
+    def product_urls(self):
+        self.flush()
+        return [url for url, in self.connection.execute('SELECT product_url FROM products WHERE product_url IS NOT NULL ORDER BY rowid')]
+
+    def count(self):
+        self.flush()
+        return self.connection.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    # Exporting
+
+    def export(self, path):
+        """Write every product to a products.csv, products.jsonl or products.json file, atomically.
+
+        The CSV keeps the products.csv columns, the JSON files the records as
+        stored, product URLs included. Products are written one at a time,
+        all of them: unlike a crawl's sinks, product IDs of different runs
+        may repeat here. Returns the number of products written.
+
+        .parquet and .arrow paths get a columnar export, see columnar.export_columnar.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension in COLUMNAR_EXTENSIONS:
+            return export_columnar(self, path)
+        if extension not in ('.csv', '.jsonl', '.json'):
+            raise ValueError(f"Unsupported export {path!r}, expected .csv, .jsonl, .json, .parquet or .arrow")
+
+        temp_path = f"{path}.tmp"
+        count = 0
+        with open(temp_path, 'w', newline='', encoding='utf-8') as export_file:
+            if extension == '.csv':
+                writer = csv.DictWriter(export_file, fieldnames=PRODUCT_FIELDNAMES)
+                writer.writeheader()
+            elif extension == '.json':
+                export_file.write('[')
+
+            for product in self.query():
+                if extension == '.csv':
+                    product.pop('product_url', None)
+                    writer.writerow(csv_row(product))
+                elif extension == '.jsonl':
+                    export_file.write(json.dumps(product, ensure_ascii=False) + '\n')
+                else:
+                    export_file.write(json_array_item(product, first=not count))
+                count += 1
+
+            if extension == '.json':
+                export_file.write('\n]' if count else ']')
+        os.replace(temp_path, path)
+        return count
+
+    def close(self, finalize=True):
+        """Write the queued records and close the database.
+
+        Upserts can be replayed, so what was queued is kept even when a crawl
+        fails and `finalize` is False.
+        """
+        if self.connection is None:
+            return
+        self.flush()
+        self.connection.close()
+        self.connection = None
+
+    def report(self):
+        print(f"Catalog: {self.count()} products in {self.path}, {self.written} written this run")
+
+
+def is_catalog_path(path):
+    return os.path.splitext(path)[1].lower() in CATALOG_EXTENSIONS
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Merge crawl outputs into the SQLite catalog, look products up and export them.")
+    arg_parser.add_argument('--catalog', default='catalog.db')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    import_command = commands.add_parser('import', help="Merge products.csv / .jsonl / .json files into the catalog")
+    import_command.add_argument('paths', nargs='+')
+    export_command = commands.add_parser('export', help="Write the catalog to products.csv / .jsonl / .json / .parquet / .arrow files")
+    export_command.add_argument('paths', nargs='+')
+    lookup_command = commands.add_parser('lookup', help="Print the products matching a URL, SKU or category")
+    lookup_group = lookup_command.add_mutually_exclusive_group(required=True)
+    lookup_group.add_argument('--url')
+    lookup_group.add_argument('--sku')
+    lookup_group.add_argument('--category')
+    args = arg_parser.parse_args()
+
+    store = CatalogStore(args.catalog)
+    if args.command == 'import':
+        for path in args.paths:
+            try:
+                print(f"Merged {store.import_file(path)} products from {path}")
+            except ValueError as err:
+                store.close()
+                raise SystemExit(str(err))
+        store.report()
+    elif args.command == 'export':
+        for path in args.paths:
+            print(f"Exported {store.export(path)} products to {path}")
+    else:
+        if args.url:
+            products = [product for product in [store.get(args.url)] if product]
+        elif args.sku:
+            products = store.find_sku(args.sku)
+        else:
+            products = store.in_category(int(args.category) if args.category.isdigit() else args.category)
+        for product in products:
+            print(json.dumps(product, ensure_ascii=False, indent=2))
+        print(f"{len(products)} products found")
+    store.close()
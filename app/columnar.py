@@ -0,0 +1,182 @@
+import os
+from datetime import datetime
+
+COLUMNAR_EXTENSIONS = ('.parquet', '.arrow')
+
+# Rows per Parquet row group / Arrow record batch, the unit that min/max statistics prune
+COLUMNAR_BATCH_SIZE = 1024
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError("Parquet and Arrow exports need `pip install pyarrow`") from err
+    return pyarrow
+
+
+def variations_path(path):
+    """products.parquet -> products.variations.parquet"""
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.variations{extension}"
+
+
+def product_schema(pa):
+    """One row per product. The HTML columns come last and are only read when projected."""
+    label = pa.dictionary(pa.int32(), pa.string())
+    crawl_time = pa.timestamp('s', tz='UTC')
+    return pa.schema([
+        ('product_key', pa.string()),
+        ('product_url', pa.string()),
+        ('product_id', pa.int64()),
+        ('product_sku', pa.string()),
+        ('product_name', pa.string()),
+        ('price', pa.int64()),
+        ('special_price', pa.int64()),
+        # Category names as crawled, or the category IDs of a mapped dataset
+        ('categories', pa.list_(label)),
+        ('category_ids', pa.list_(pa.int64())),
+        ('product_type', label),
+        ('image_url', pa.string()),
+        ('variation_matrix', pa.string()),
+        ('first_crawled_at', crawl_time),
+        ('crawled_at', crawl_time),
+        ('description', pa.string()),
+        ('short_description', pa.string()),
+    ])
+
+
+def variation_schema(pa):
+    """One row per product attribute, with its options nested, joined to products on product_key."""
+    label = pa.dictionary(pa.int32(), pa.string())
+    option = pa.struct([
+        ('attribute_option_code', pa.string()),
+        ('attribute_option_price', pa.int64()),
+    ])
+    return pa.schema([
+        ('product_key', pa.string()),
+        ('product_id', pa.int64()),
+        ('attribute_position', pa.int32()),
+        ('attribute_name', label),
+        ('attribute_code', label),
+        ('options', pa.list_(option)),
+    ])
+
+
+def product_row(row, product):
+    """A products table row from a catalog row and its record."""
+    category_ids = bool(row['category_ids'])
+    return {
+        'product_key': row['product_key'],
+        'product_url': row['product_url'],
+        'product_id': product['product_id'],
+        'product_sku': product['product_sku'],
+        'product_name': product['product_name'],
+        'price': product['price'],
+        'special_price': product['special_price'],
+        'categories': None if category_ids else [name for name in product['category'].split(', ') if name],
+        'category_ids': product['category'] if category_ids else None,
+        'product_type': product['product_type'],
+        'image_url': product['image_url'] or None,
+        'variation_matrix': row['variation_matrix'],
+        'first_crawled_at': datetime.fromisoformat(row['first_crawled_at']),
+        'crawled_at': datetime.fromisoformat(row['crawled_at']),
+        'description': product['description'],
+        'short_description': product['short_description'],
+    }
+
+
+def variation_rows(row, product):
+    variations = product['variations'] or []
+    # Variation codes of the older crawlers, as one attribute without a name
+    legacy_options = [{'attribute_option_code': item['variation_code'], 'attribute_option_price': item['variation_price']} for item in variations if 'variation_code' in item]
+    attributes = [item for item in variations if 'options' in item]
+    if legacy_options:
+        attributes.append({'attribute_name': None, 'attribute_code': None, 'options': legacy_options})
+    for attribute_position, attribute in enumerate(attributes):
+        yield {
+            'product_key': row['product_key'],
+            'product_id': product['product_id'],
+            'attribute_position': attribute_position,
+            'attribute_name': attribute['attribute_name'],
+            'attribute_code': attribute['attribute_code'],
+            'options': attribute['options'],
+        }
+
+
+class TableWriter:
+    """Writes rows to a Parquet or Arrow IPC file in batches of COLUMNAR_BATCH_SIZE, under a temporary name."""
+
+    def __init__(self, pa, path, schema):
+        self.pa = pa
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.schema = schema
+        self.rows = []
+        self.written = 0
+        if path.lower().endswith('.parquet'):
+            self.writer = pa.parquet.ParquetWriter(self.temp_path, schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(self.temp_path, schema)
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= COLUMNAR_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_batch(self.pa.RecordBatch.from_pylist(self.rows, schema=self.schema))
+            self.written += len(self.rows)
+            self.rows = []
+
+    def close(self, finalize=True):
+        if finalize:
+            self.flush()
+        self.writer.close()
+        if finalize:
+            os.replace(self.temp_path, self.path)
+        else:
+            os.remove(self.temp_path)
+
+
+def export_columnar(store, path):
+    """Write a CatalogStore as a products table at `path` and its variations next to it.
+
+    `path` is a .parquet file (zstd compressed) or an Arrow IPC .arrow
+    file; the variations go to products.variations.parquet (or .arrow).
+    Prices and IDs are int64 columns, categories, product types and
+    attribute names dictionary-encoded, and crawl times UTC timestamps, so
+    readers can project columns and filter on them without loading the
+    descriptions (see read_columnar). Returns the number of products written.
+    """
+    pa = import_pyarrow()
+    products = TableWriter(pa, path, product_schema(pa))
+    variations = TableWriter(pa, variations_path(path), variation_schema(pa))
+    try:
+        for row, product in store.records():
+            products.write(product_row(row, product))
+            for variation in variation_rows(row, product):
+                variations.write(variation)
+    except BaseException:
+        products.close(finalize=False)
+        variations.close(finalize=False)
+        raise
+    products.close()
+    variations.close()
+    return products.written
+
+
+def read_columnar(path, columns=None, filter=None):
+    """Read an exported table, only `columns` and only the rows matching `filter`.
+
+    `filter` is a pyarrow.dataset expression, e.g.
+    `pyarrow.dataset.field('price') < 100000`; Parquet row groups whose
+    statistics rule it out are skipped without being read.
+    """
+    pa = import_pyarrow()
+    file_format = 'parquet' if path.lower().endswith('.parquet') else 'ipc'
+    return pa.dataset.dataset(path, format=file_format).to_table(columns=columns, filter=filter)
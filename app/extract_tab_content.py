@@ -1,5 +1,9 @@
 import requests
-from bs4 import BeautifulSoup
+
+from parsers import get_backend
+from extraction import PRODUCT_FIELDS, select_fields
+
+DESCRIPTION_SPEC = select_fields(PRODUCT_FIELDS, 'description')
 
 def extract_description_content(url):
     try:
@@ -8,21 +12,11 @@ def extract_description_content(url):
             print(f"Failed to fetch the page. Status code: {response.status_code}")
             return {}
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        product_details = {}
-
-        # Extract content from the description tab
-        description_panel = soup.find('div', class_='woocommerce-Tabs-panel--description')
-        if description_panel:
+        # Extract content from the description tab, keeping its HTML structure
+        product_details = get_backend().parse_fields(response.content, DESCRIPTION_SPEC)
+        if 'description' in product_details:
             print("Description panel found.")
-            # Extract the content while keeping HTML structure
-            description_content = description_panel.decode_contents().strip()
-            print(f"Extracted description content: {description_content[:100]}...")  # Log first 100 characters
-
-            # Store the content in the product details with the key 'description'
-            product_details['description'] = description_content
-            print(f"Added description content.")
-
+            print(f"Extracted description content: {product_details['description'][:100]}...")  # Log first 100 characters
         else:
             print("No description panel found.")
 
@@ -0,0 +1,332 @@
+import html as html_lib
+import json
+import re
+import unicodedata
+from typing import Any, Callable, NamedTuple, Optional, Tuple, Union
+
+class _Missing:
+    def __repr__(self):
+        return 'MISSING'
+
+    def __reduce__(self):
+        # Stay the same object when specs are sent to parse worker processes
+        return 'MISSING'
+
+
+# Value of a field whose selector matched nothing, the key is left out of the record
+MISSING = _Missing()
+
+
+class Field(NamedTuple):
+    """One field of an extraction spec.
+
+    `selector` is a CSS selector, or a tuple of selectors where each one is
+    looked up inside the first match of the previous one. `read` says what is
+    taken from the match:
+
+    - 'text', 'spaced_text', 'outer_html', 'inner_html': the matched node
+    - 'attr:<name>': an attribute of the matched node (empty counts as missing)
+    - 'texts': the text of every match of the last selector, as a list
+    - 'exists': whether anything matched
+    - 'variations:<style>': the variations of a variations form, see
+      ParserBackend.parse_variations
+
+    `post` then cleans the value up and `type` converts it. `default` is
+    used when nothing matched, MISSING leaves the key out of the record.
+
+    `jsonld`, if set, reads the field from the page's schema.org Product
+    instead, for ParserBackend.parse_product_jsonld. It returns MISSING when
+    JSON-LD doesn't tell, the field is then read from the page as usual.
+    """
+
+    name: str
+    selector: Union[str, Tuple[str, ...]]
+    read: str = 'text'
+    post: Optional[Callable] = None
+    type: Optional[Callable] = None
+    default: Any = MISSING
+    jsonld: Optional[Callable] = None
+
+
+# Post-processors
+
+def remove_accents(input_str):
+    """Remove accents from the input string."""
+    nfkd_form = unicodedata.normalize('NFD', input_str)
+    return re.sub(r'[\u0300-\u036f]', '', nfkd_form).replace('đ', 'd').replace('Đ', 'D')
+
+
+def generate_product_sku(product_name):
+    """Generate product SKU from product name."""
+    product_sku = re.sub(r'[^\w\s]', '', product_name).lower().replace(' ', '_')
+    return remove_accents(product_sku)
+
+
+def sku_from_title(title):
+    return generate_product_sku(title.strip())
+
+
+def parse_price_text(price_text):
+    """Turn a displayed price ('1.250.000 ₫') into an integer."""
+    return int(price_text.strip().split('₫')[0].replace('.', '').replace(',', '').strip() or 0)
+
+
+def price_digits(price_text):
+    """Turn a displayed price into its digits as a string ('1.250.000 ₫' -> '1250000')."""
+    return price_text.strip().split('₫')[0].replace('.', '').replace(',', '').strip()
+
+
+def legacy_price_text(price_text):
+    """The whole price block as text without the currency sign, as the v3/v4 crawlers export it."""
+    return price_text.strip().replace('₫', '').replace('&nbsp;', '')
+
+
+def join_texts(texts):
+    return ', '.join(text.strip() for text in texts)
+
+
+def product_type(has_variations_form):
+    return 'configurable' if has_variations_form else 'simple'
+
+
+# JSON-LD
+
+JSONLD_SCRIPT = re.compile(r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.DOTALL | re.IGNORECASE)
+
+
+def iter_jsonld_nodes(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from iter_jsonld_nodes(item)
+    elif isinstance(data, dict):
+        yield data
+        yield from iter_jsonld_nodes(data.get('@graph'))
+
+
+def find_jsonld_product(html):
+    """The first schema.org Product of the page's JSON-LD blocks, found by a scan of the raw HTML."""
+    for match in JSONLD_SCRIPT.finditer(html):
+        try:
+            data = json.loads(match.group(1))
+        except json.JSONDecodeError:
+            continue
+        for node in iter_jsonld_nodes(data):
+            node_type = node.get('@type')
+            if node_type == 'Product' or (isinstance(node_type, list) and 'Product' in node_type):
+                return node
+    return None
+
+
+def jsonld_name(product):
+    name = product.get('name')
+    return html_lib.unescape(name).strip() if isinstance(name, str) and name.strip() else MISSING
+
+
+def jsonld_sku(product):
+    name = jsonld_name(product)
+    return MISSING if name is MISSING else generate_product_sku(name)
+
+
+def jsonld_image(product):
+    image = product.get('image')
+    if isinstance(image, list):
+        image = image[0] if image else None
+    if isinstance(image, dict):
+        image = image.get('url') or image.get('contentUrl')
+    return image if isinstance(image, str) and image else MISSING
+
+
+def jsonld_sale_prices(product):
+    """(regular price, sale price) of a product on sale, or None when JSON-LD doesn't show both.
+
+    The Offer price alone is ambiguous, it is the regular price or the sale
+    price depending on the sale, so both are only known when the Offer lists
+    its strikethrough/list price as well.
+    """
+    offers = product.get('offers')
+    if isinstance(offers, list):
+        offers = offers[0] if len(offers) == 1 else None
+    if not isinstance(offers, dict) or offers.get('@type') != 'Offer':
+        return None
+
+    specifications = offers.get('priceSpecification')
+    specifications = specifications if isinstance(specifications, list) else [specifications]
+    regular_price = next((
+        specification.get('price') for specification in specifications
+        if isinstance(specification, dict) and str(specification.get('priceType', '')).endswith(('ListPrice', 'StrikethroughPrice'))
+    ), None)
+    try:
+        regular_price = int(float(regular_price))
+        sale_price = int(float(offers.get('price')))
+    except (TypeError, ValueError):
+        return None
+    return (regular_price, sale_price) if 0 < sale_price < regular_price else None
+
+
+def jsonld_price(product):
+    prices = jsonld_sale_prices(product)
+    return prices[0] if prices else MISSING
+
+
+def jsonld_special_price(product):
+    prices = jsonld_sale_prices(product)
+    return prices[1] if prices else MISSING
+
+
+# Specs
+
+PRODUCT_TITLE = 'h1.product-title'
+PRICE_BLOCK = 'p.price'
+VARIATIONS_FORM = 'form.variations_form.cart'
+
+# Product pages, as exported by v6
+PRODUCT_FIELDS = (
+    Field('product_name', PRODUCT_TITLE, post=str.strip, jsonld=jsonld_name),
+    Field('product_sku', PRODUCT_TITLE, post=sku_from_title, jsonld=jsonld_sku),
+    Field('image_url', 'meta[property="og:image"]', read='attr:content', jsonld=jsonld_image),
+    # The first <bdi> of the price block is the regular price, crossed out (<del>) when on sale
+    Field('price', (PRICE_BLOCK, 'bdi'), post=parse_price_text, type=int, default=0, jsonld=jsonld_price),
+    Field('special_price', (PRICE_BLOCK, 'ins bdi'), post=parse_price_text, type=int, default=0, jsonld=jsonld_special_price),
+    # Short description keeps its HTML for CKEditor
+    Field('short_description', 'div.product-short-description', read='outer_html'),
+    Field('category', ('span.posted_in', 'a[rel~="tag"]'), read='texts', post=join_texts),
+    Field('description', 'div.woocommerce-Tabs-panel--description', read='inner_html', post=str.strip),
+    Field('product_type', VARIATIONS_FORM, read='exists', post=product_type),
+    Field('variations', VARIATIONS_FORM, read='variations:options_or_base_price', default=None),
+    Field('variation_matrix', VARIATIONS_FORM, read='variations:matrix', default=None),
+    # Only set when the variations have to be fetched over AJAX, the crawler resolves and removes it
+    Field('variation_lookup', VARIATIONS_FORM, read='variations:lookup'),
+)
+
+# Product pages, as exported by the v3 and v4 crawlers
+LEGACY_PRODUCT_FIELDS = (
+    Field('product_name', PRODUCT_TITLE, post=str.strip),
+    Field('price', PRICE_BLOCK, post=legacy_price_text),
+    Field('short_description', 'div.product-short-description', post=str.strip),
+    Field('category', ('span.posted_in', 'a[rel~="tag"]'), read='texts', post=join_texts),
+    Field('product_type', VARIATIONS_FORM, read='exists', post=product_type),
+    Field('variations', VARIATIONS_FORM, read='variations:codes', default=None),
+)
+
+# Listing tiles (div.product-small), a tile without a product URL is skipped
+LISTING_TILE_FIELDS = (
+    Field('product_url', 'p.name.product-title.woocommerce-loop-product__title a', read='attr:href'),
+    Field('image_url', 'img', read='attr:src'),
+    # Displayed price, so changed tiles can be detected on the next run
+    Field('listing_price', 'span.price', read='spaced_text'),
+)
+
+# Listing tiles, as read by the crawlers before v6
+LEGACY_LISTING_TILE_FIELDS = LISTING_TILE_FIELDS[:2]
+
+# Listing tiles with their name, category and prices, as exported by the v1 and v2 crawlers.
+# Run the records through legacy_tile_prices, a tile has either a price or original/sale prices.
+LEGACY_PRICED_TILE_FIELDS = (
+    Field('product_name', ('p.name.product-title.woocommerce-loop-product__title', 'a'), post=str.strip),
+    Field('product_url', 'p.name.product-title.woocommerce-loop-product__title a', read='attr:href'),
+    Field('category', 'p.category', post=str.strip),
+    Field('original_price', ('span.price', 'del'), post=str.strip),
+    Field('sale_price', ('span.price', 'ins'), post=str.strip),
+    Field('price', 'span.price', post=legacy_price_text),
+    Field('image_url', 'img', read='attr:src'),
+)
+
+
+def legacy_tile_prices(record):
+    """Keep the prices of a LEGACY_PRICED_TILE_FIELDS record that v1/v2 export, and set its product type from them."""
+    if 'price' not in record:
+        return record
+    if 'original_price' in record:
+        # On sale, only simple products show a crossed out price
+        del record['price']
+        record['product_type'] = 'simple'
+        return record
+    record.pop('sale_price', None)
+    if '–' in record['price']:
+        # A price range means it's configurable
+        record['price'] = record['price'].strip()
+        record['product_type'] = 'configurable'
+    else:
+        record['product_type'] = 'simple'
+    return record
+
+
+def field_map(fields):
+    return {field.name: field for field in fields}
+
+
+def select_fields(fields, *names):
+    """The fields of a spec with the given names, in that order."""
+    by_name = field_map(fields)
+    return tuple(by_name[name] for name in names)
+
+
+def replace_fields(fields, *replacements):
+    """A spec with same-named fields swapped for `replacements`, new ones appended at the end."""
+    by_name = field_map(replacements)
+    replaced = tuple(by_name.pop(field.name, field) for field in fields)
+    return replaced + tuple(by_name.values())
+
+
+def compile_fields(backend, fields):
+    """Compile a spec into a callable extractor(root, product_url=None, record=None) -> dict for one backend.
+
+    Selectors are compiled once here, so extracting a record is only a walk
+    over precompiled matchers. Fields are added to `record` when given.
+    """
+    compiled = [compile_field(backend, field) for field in fields]
+
+    def extract(root, product_url=None, record=None):
+        record = {} if record is None else record
+        for name, read_value in compiled:
+            value = read_value(root, record, product_url)
+            if value is not MISSING:
+                record[name] = value
+        return record
+
+    return extract
+
+
+def compile_field(backend, field):
+    selectors = field.selector if isinstance(field.selector, tuple) else (field.selector,)
+    matchers = [backend.compile_selector(selector) for selector in selectors]
+    read, _, argument = field.read.partition(':')
+    read_all = read == 'texts'
+
+    def locate(root):
+        node = root
+        for select_first, _ in matchers[:-1]:
+            node = select_first(node)
+            if node is None:
+                return None
+        select_first, select_all = matchers[-1]
+        return select_all(node) if read_all else select_first(node)
+
+    if read == 'exists':
+        read_node = lambda node, root, record, product_url: node is not None
+    elif read == 'texts':
+        read_node = lambda nodes, root, record, product_url: [backend.text(node) for node in nodes]
+    elif read == 'attr':
+        read_node = lambda node, root, record, product_url: backend.attr(node, argument) or None
+    elif read == 'variations':
+        read_node = lambda node, root, record, product_url: backend.parse_variations(root, node, argument, record.get('price', 0), product_url)
+    elif read in ('text', 'spaced_text', 'outer_html', 'inner_html'):
+        node_reader = getattr(backend, read)
+        read_node = lambda node, root, record, product_url: node_reader(node)
+    else:
+        raise ValueError(f"Unknown read {field.read!r} for field {field.name!r}")
+
+    def read_value(root, record, product_url):
+        node = locate(root)
+        if node is None and read != 'exists':
+            return field.default
+        value = read_node(node, root, record, product_url)
+        if value is None:
+            return field.default
+        if field.post:
+            value = field.post(value)
+        if field.type:
+            value = field.type(value)
+        return value
+
+    return field.name, read_value
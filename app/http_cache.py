@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import Counter
+
+
+class CacheMiss(Exception):
+    """The cached body of a revalidated URL is gone, it has to be fetched again."""
+
+
+class HttpCache:
+    """Persistent response cache that revalidates with ETag / Last-Modified.
+
+    Bodies are stored as files under `cache_dir`, next to an index of their
+    validators. Entries are evicted least recently used first once the cache
+    grows past `max_bytes`, except those with a conditional request out:
+    they stay pinned from conditional_headers() until release().
+    """
+
+    def __init__(self, cache_dir='./.http_cache', max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.entries = {}
+        self.pinned = Counter()
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as index_file:
+                    self.entries = json.load(index_file)
+            except (OSError, json.JSONDecodeError) as err:
+                print(f"Ignoring unreadable cache index {self.index_path}: {err}")
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    def _body_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def conditional_headers(self, url):
+        """Return the If-None-Match / If-Modified-Since headers for a cached URL.
+
+        The entry is pinned against eviction until release(url), so the body
+        is still there if the server answers 304.
+        """
+        entry = self.entries.get(url)
+        if not entry:
+            return {}
+        if not os.path.exists(self._body_path(url)):
+            # Body was removed behind our back, don't ask for a 304 we can't serve
+            del self.entries[url]
+            return {}
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        if headers:
+            self.pinned[url] += 1
+        return headers
+
+    def release(self, url):
+        """Unpin an entry once the response to its conditional request is handled."""
+        self.pinned[url] -= 1
+        if self.pinned[url] <= 0:
+            del self.pinned[url]
+
+    def record_hit(self, url, size, elapsed):
+        if url in self.entries:
+            self.entries[url]['last_used'] = time.time()
+        self.hits += 1
+        self.bytes_saved += size
+        self.hit_seconds += elapsed
+
+    def forget(self, url, err):
+        """Drop an entry whose body is gone and raise CacheMiss."""
+        self.entries.pop(url, None)
+        raise CacheMiss(url) from err
+
+    def load(self, url, elapsed=0.0):
+        """Return the cached body of a URL after a 304, and count the hit.
+
+        Raises CacheMiss when the body was removed behind our back.
+        """
+        try:
+            with open(self._body_path(url), 'rb') as body_file:
+                body = body_file.read()
+        except FileNotFoundError as err:
+            self.forget(url, err)
+
+        self.record_hit(url, len(body), elapsed)
+        return body
+
+    def copy_to(self, url, path, elapsed=0.0):
+        """Copy the cached body of a URL to `path` after a 304, and count the hit."""
+        try:
+            shutil.copyfile(self._body_path(url), path)
+        except FileNotFoundError as err:
+            self.forget(url, err)
+        self.record_hit(url, os.path.getsize(path), elapsed)
+
+    def load_text(self, url, elapsed=0.0):
+        encoding = self.entries.get(url, {}).get('encoding')
+        body = self.load(url, elapsed)
+        return body.decode(encoding or 'utf-8', errors='replace')
+
+    def store(self, url, headers, body, encoding=None, elapsed=0.0):
+        """Store a full response body if it carries validators, and count the miss."""
+        self.misses += 1
+        self.miss_seconds += elapsed
+
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+
+        with open(self._body_path(url), 'wb') as body_file:
+            body_file.write(body)
+        self.add_entry(url, etag, last_modified, encoding, len(body))
+
+    def store_file(self, url, headers, path, elapsed=0.0):
+        """Like store, but copies the body from a file instead of holding it in memory."""
+        self.misses += 1
+        self.miss_seconds += elapsed
+
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+
+        shutil.copyfile(path, self._body_path(url))
+        self.add_entry(url, etag, last_modified, None, os.path.getsize(path))
+
+    def add_entry(self, url, etag, last_modified, encoding, size):
+        self.entries[url] = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'encoding': encoding,
+            'size': size,
+            'last_used': time.time(),
+        }
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        total_size = sum(entry['size'] for entry in self.entries.values())
+        if total_size <= self.max_bytes:
+            return
+
+        for url, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']):
+            if url in self.pinned:
+                continue
+            try:
+                os.remove(self._body_path(url))
+            except FileNotFoundError:
+                pass
+            del self.entries[url]
+            total_size -= entry['size']
+            if total_size <= self.max_bytes:
+                break
+
+    def save(self):
+        """Write the index to disk atomically."""
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as index_file:
+            json.dump(self.entries, index_file)
+        os.replace(temp_path, self.index_path)
+
+    def report(self):
+        """Print hit/miss counters and an estimate of the bandwidth and time saved."""
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total else 0
+        print(f"HTTP cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate)")
+
+        # A hit would have cost roughly as long as an average full download
+        time_saved = 0.0
+        if self.hits and self.misses:
+            time_saved = self.hits * (self.miss_seconds / self.misses - self.hit_seconds / self.hits)
+        print(f"HTTP cache: saved {self.bytes_saved / (1024 * 1024):.2f} MB and ~{max(time_saved, 0):.2f} seconds")
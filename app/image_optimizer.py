@@ -3,8 +3,8 @@ import asyncio
 from PIL import Image
 from tqdm import tqdm
 
-async def optimize_image(image_path, output_folder, max_size=(800, 800), quality=85):
-    """Optimize a single image and save it to the specified output folder."""
+def optimize_image_sync(image_path, output_folder, max_size=(800, 800), quality=85):
+    """Optimize a single image synchronously, suitable for running in a worker thread."""
     try:
         with Image.open(image_path) as img:
             # Resize the image if it's larger than max_size
@@ -33,6 +33,10 @@ async def optimize_image(image_path, output_folder, max_size=(800, 800), quality
         print(f"Error optimizing image {image_path}: {err}")
         return None
 
+async def optimize_image(image_path, output_folder, max_size=(800, 800), quality=85):
+    """Optimize a single image and save it to the specified output folder."""
+    return optimize_image_sync(image_path, output_folder, max_size, quality)
+
 async def optimize_images_in_folder(input_folder, output_folder):
     """Optimize all images in the input folder and save them to the output folder."""
     tasks = []
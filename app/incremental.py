@@ -0,0 +1,95 @@
+import copy
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+from sitemap import parse_lastmod
+
+
+def listing_fingerprint(product):
+    """Fingerprint a listing tile from its product URL, image URL and displayed price."""
+    tile = '\n'.join([product.get('product_url', ''), product.get('image_url', ''), product.get('listing_price', '')])
+    return hashlib.sha1(tile.encode('utf-8')).hexdigest()
+
+
+class IncrementalState:
+    """Listing fingerprints and product records kept between runs.
+
+    A product whose listing tile fingerprint matches the previous run is
+    carried forward from the stored record instead of being fetched again.
+    Products discovered through the sitemap are carried forward instead when
+    their <lastmod> is older than the last successful crawl.
+    """
+
+    def __init__(self, state_path='./crawl_state.json'):
+        self.state_path = state_path
+        self.previous = {}
+        self.current = {}
+        self.last_crawl = None
+        self.started_at = datetime.now(timezone.utc)
+        self.carried = 0
+        self.fetched = 0
+
+        if os.path.exists(state_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as state_file:
+                    state = json.load(state_file)
+                self.previous = state.get('products', {})
+                self.last_crawl = parse_lastmod(state.get('last_crawl'))
+            except (OSError, json.JSONDecodeError, AttributeError) as err:
+                print(f"Ignoring unreadable crawl state {state_path}: {err}")
+
+    def is_unchanged(self, product, entry):
+        if 'lastmod' in product:
+            lastmod = parse_lastmod(product['lastmod'])
+            return bool(self.last_crawl and lastmod and lastmod < self.last_crawl)
+        return entry['fingerprint'] == listing_fingerprint(product)
+
+    def carry_forward(self, product):
+        """Return the previous record for an unchanged listing tile, or None if it must be fetched."""
+        entry = self.previous.get(product.get('product_url'))
+        if not entry or not self.is_unchanged(product, entry):
+            return None
+
+        # Product IDs follow the listing order of this run
+        record = copy.deepcopy(entry['record'])
+        record['product_id'] = product['product_id']
+        self.carried += 1
+        self.remember(product, record, fetched=False)
+        return record
+
+    def remember(self, product, record, fetched=True):
+        """Store the record of a listing tile for the next run."""
+        if fetched:
+            self.fetched += 1
+        self.current[product['product_url']] = {
+            'fingerprint': listing_fingerprint(product),
+            'record': {**copy.deepcopy(record), 'image_url': product.get('image_url')},
+        }
+
+    def entry(self, product):
+        """What this run keeps of a product for the next one, or None."""
+        return self.current.get(product.get('product_url'))
+
+    def restore(self, product, entry=None):
+        """Keep a product finished before a resume, from its journaled entry or else last run's."""
+        entry = entry or self.previous.get(product.get('product_url'))
+        if entry:
+            self.current[product['product_url']] = entry
+
+    def resume_run(self, started_at):
+        """Continue an interrupted run, it counts as crawled from when that run started."""
+        self.started_at = started_at
+
+    def save(self):
+        """Write the state of this run to disk atomically, marking it as the last successful crawl."""
+        # Use the start time, anything modified while the crawl ran is fetched again next time
+        state = {'last_crawl': self.started_at.isoformat(), 'products': self.current}
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as state_file:
+            json.dump(state, state_file, ensure_ascii=False)
+        os.replace(temp_path, self.state_path)
+
+    def report(self):
+        print(f"Incremental crawl: fetched {self.fetched} new or changed products, carried forward {self.carried} unchanged")
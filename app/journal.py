@@ -0,0 +1,195 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from sinks import RecordSink
+
+
+class CrawlJournal:
+    """The frontier of a crawl on disk, so a killed or crashed run can be resumed.
+
+    An append-only JSON Lines file with one entry per line:
+
+    - {"started": time}: when the crawl first started, resumes keep it
+    - {"page": [tiles]}: a listing page as it was yielded, with its product IDs
+    - {"listed": true}: every listing page has been seen
+    - {"checkpoint": {output: size}, "products": [[url, id, sku, image_url, state], ...]}:
+      products whose records are in the outputs' .part files, flushed up to
+      those sizes. `state` is the product's IncrementalState entry, or null
+      when the crawl isn't incremental
+    - {"image": url}: an image that was downloaded (and optimized, when streaming)
+
+    Resuming replays the listing pages, truncates the .part files to the
+    last checkpoint and skips the products and images already done, so it
+    only costs a scan of the journal.
+    """
+
+    def __init__(self, journal_path='crawl_journal.jsonl', outputs=(), resume=False, checkpoint_every=50, checkpoint_interval=5.0):
+        self.journal_path = journal_path
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.pending = []
+        self.last_checkpoint = time.monotonic()
+        self.reset()
+
+        self.resumed = resume and os.path.exists(journal_path)
+        if self.resumed:
+            self.load()
+            missing_outputs = [output for output in outputs if not self.output_intact(output)]
+            if missing_outputs:
+                print(f"Can't resume, {', '.join(missing_outputs)} doesn't match {journal_path}, starting over")
+                self.reset()
+                self.resumed = False
+
+        self.file = open(journal_path, 'a' if self.resumed else 'w', encoding='utf-8')
+        if not self.resumed:
+            self.started_at = datetime.now(timezone.utc)
+            self.record({'started': self.started_at.isoformat()})
+
+    def reset(self):
+        self.started_at = None
+        self.pages = []
+        self.listed = False
+        self.products = {}
+        self.states = {}
+        self.images = set()
+        self.output_sizes = {}
+
+    def load(self):
+        valid_size = 0
+        with open(self.journal_path, 'rb') as journal_file:
+            for line in journal_file:
+                # A killed run can leave the last entry half written
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                self.apply(entry)
+                valid_size += len(line)
+        os.truncate(self.journal_path, valid_size)
+
+    def apply(self, entry):
+        if 'started' in entry:
+            self.started_at = datetime.fromisoformat(entry['started'])
+        elif 'page' in entry:
+            self.pages.append(entry['page'])
+        elif 'listed' in entry:
+            self.listed = True
+        elif 'checkpoint' in entry:
+            self.output_sizes = entry['checkpoint']
+            # Journals of older runs have no incremental state entries
+            for product_url, product_id, product_sku, image_url, *state in entry['products']:
+                self.products[product_url] = (product_id, product_sku, image_url)
+                if state and state[0]:
+                    self.states[product_url] = state[0]
+        elif 'image' in entry:
+            self.images.add(entry['image'])
+
+    def output_intact(self, output):
+        """Whether the .part file of an output still holds everything up to the last checkpoint."""
+        if not self.products:
+            return True
+        temp_path = f"{output}.part"
+        return output in self.output_sizes and os.path.exists(temp_path) and os.path.getsize(temp_path) >= self.output_sizes[output]
+
+    def record(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.file.flush()
+
+    def describe(self):
+        return f"{len(self.pages)} listing pages{' (all)' if self.listed else ''}, {len(self.products)} products and {len(self.images)} images"
+
+    # Listing
+
+    @property
+    def next_page(self):
+        return len(self.pages) + 1
+
+    @property
+    def next_product_id(self):
+        return max((product['product_id'] for page in self.pages for product in page), default=0) + 1
+
+    async def track_pages(self, product_pages, skip_pages=0):
+        """Yield the journaled listing pages, then the rest of `product_pages`, journaling each one.
+
+        `product_pages` is only iterated when the listing wasn't finished,
+        and its first `skip_pages` pages are dropped (for discovery that
+        can't start at a given page).
+        """
+        for page_products in self.pages:
+            yield page_products
+        if self.listed:
+            return
+
+        async for page_products in product_pages:
+            if skip_pages:
+                skip_pages -= 1
+                continue
+            self.record({'page': page_products})
+            yield page_products
+        self.record({'listed': True})
+
+    # Products
+
+    def is_done(self, product):
+        return product.get('product_url') in self.products
+
+    def state_entry(self, product):
+        """The IncrementalState entry journaled with a finished product, or None."""
+        return self.states.get(product.get('product_url'))
+
+    def pending_image(self, product):
+        """(image URL, SKU) of a finished product whose image wasn't done, or None."""
+        _, product_sku, image_url = self.products[product['product_url']]
+        if not product_sku or not image_url or image_url in self.images:
+            return None
+        return image_url, product_sku
+
+    def sink_options(self, output):
+        """open_sink options that continue an output from the last checkpoint."""
+        if not self.resumed or output not in self.output_sizes:
+            return {}
+        return {'resume_size': self.output_sizes[output], 'product_ids': [product_id for product_id, _, _ in self.products.values()]}
+
+    def product_written(self, product, detailed_product, sinks, state_entry=None):
+        """Note a product written to the outputs, it counts as done at the next checkpoint.
+
+        `state_entry` is what an incremental crawl keeps of the product, a
+        resumed run hands it back to its IncrementalState.
+        """
+        self.pending.append([product['product_url'], detailed_product['product_id'], detailed_product.get('product_sku'), detailed_product.get('image_url'), state_entry])
+        if len(self.pending) >= self.checkpoint_every or time.monotonic() - self.last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint(sinks)
+
+    def checkpoint(self, sinks):
+        """Flush the outputs and journal the products written to them since the last checkpoint."""
+        self.last_checkpoint = time.monotonic()
+        if not self.pending:
+            return
+        for sink in sinks:
+            sink.flush()
+            # The catalog commits on flush and its upserts can be replayed, only files are cut back on resume
+            if isinstance(sink, RecordSink):
+                self.output_sizes[sink.path] = os.fstat(sink.file.fileno()).st_size
+        self.record({'checkpoint': self.output_sizes, 'products': self.pending})
+        self.pending = []
+
+    # Images
+
+    def has_image(self, image_url):
+        return image_url in self.images
+
+    def image_done(self, image_url):
+        self.images.add(image_url)
+        self.record({'image': image_url})
+
+    def close(self, completed=False):
+        """Close the journal, removing it once the crawl has completed."""
+        if self.file.closed:
+            return
+        self.file.close()
+        if completed:
+            os.remove(self.journal_path)
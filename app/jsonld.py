@@ -0,0 +1,41 @@
+from collections import Counter
+
+from extraction import PRODUCT_FIELDS
+from parsers import extract, get_backend
+
+
+class JsonLdFastPath:
+    """Reads product pages through ParserBackend.parse_product_jsonld and counts where each field came from.
+
+    Wraps a backend name, a ParsePool or a TemplateSlicer. Only
+    parse_product calls take the JSON-LD path, everything else is passed on.
+    """
+
+    def __init__(self, parser='bs4'):
+        self.parser = parser
+        self.pages = 0
+        self.parsed_pages = 0
+        self.hits = Counter()
+
+    async def run(self, method, *args):
+        if method != 'parse_product':
+            return await extract(self.parser, method, *args)
+
+        product, from_jsonld, parsed = await extract(self.parser, 'parse_product_jsonld', *args)
+        self.pages += 1
+        self.parsed_pages += parsed
+        self.hits.update(from_jsonld)
+        return product
+
+    def describe(self):
+        parser = f"{get_backend(self.parser).name} backend" if isinstance(self.parser, str) else self.parser.describe()
+        return f"{parser}, reading product fields from JSON-LD first"
+
+    def report(self):
+        if not self.pages:
+            return
+        hit_rates = ', '.join(
+            f"{field.name} {self.hits[field.name] / self.pages:.0%}"
+            for field in PRODUCT_FIELDS if field.jsonld
+        )
+        print(f"JSON-LD: {hit_rates} of {self.pages} product pages; {self.parsed_pages} still needed a DOM parse")
@@ -0,0 +1,760 @@
+import argparse
+import asyncio
+import functools
+import html as html_lib
+import json
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import soupsieve
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+
+from extraction import LISTING_TILE_FIELDS, MISSING, PRICE_BLOCK, PRODUCT_FIELDS, compile_fields, find_jsonld_product, select_fields
+
+
+# The only parts of a product page the product extractor reads, as (tag, class)
+PRODUCT_REGIONS = [
+    ('h1', 'product-title'),
+    ('p', 'price'),
+    ('div', 'product-short-description'),
+    ('span', 'posted_in'),
+    ('div', 'woocommerce-Tabs-panel--description'),
+    ('form', 'variations_form'),
+]
+
+# The parts of a listing page the listing extractor reads, as (tag, class)
+LISTING_REGIONS = [
+    ('div', 'products'),
+    ('div', 'product-small'),
+    ('a', 'page-number'),
+    ('a', 'page-numbers'),
+    ('span', 'page-number'),
+    ('span', 'page-numbers'),
+]
+
+
+def is_product_region(name, attrs):
+    """Whether a start tag opens one of the product page regions (or is the og:image meta)."""
+    if name == 'meta':
+        return attrs.get('property') == 'og:image'
+    classes = attrs.get('class') or ''
+    classes = classes.split() if isinstance(classes, str) else classes
+    return any(name == region_tag and region_class in classes for region_tag, region_class in PRODUCT_REGIONS)
+
+
+class ProductRegionStrainer(SoupStrainer):
+    """SoupStrainer that only builds the subtrees of PRODUCT_REGIONS.
+
+    Header, mega-menu, sidebars, footer and scripts are skipped by the tree
+    builder without ever becoming Tag objects.
+    """
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return is_product_region(name, attrs or {})
+
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        # BeautifulSoup < 4.13 asks this instead of allow_tag_creation
+        if isinstance(markup_name, str):
+            return markup_name if is_product_region(markup_name, dict(markup_attrs)) else None
+        return super().search_tag(markup_name, markup_attrs)
+
+
+def decode_html(html):
+    """Decode a raw response body the way BeautifulSoup would, so every backend sees the same text."""
+    if isinstance(html, bytes):
+        return UnicodeDammit(html, is_html=True).unicode_markup
+    return html
+
+
+PRICE_FIELDS = select_fields(PRODUCT_FIELDS, 'price', 'special_price')
+
+
+def attribute_code(attribute):
+    """'attribute_pa_kich-thuoc' -> 'kich-thuoc'"""
+    return attribute.replace('attribute_pa_', '')
+
+
+@functools.lru_cache(maxsize=16)
+def load_variations_json(variations_data):
+    """Parse a data-product_variations attribute once for all the fields that read it.
+
+    The result is shared between callers and must not be modified.
+    """
+    return json.loads(variations_data) or []
+
+
+def attribute_option_variations(variations, attributes, base_price=0):
+    """Build the per-attribute `variations` list from the variations JSON.
+
+    `attributes` comes from ParserBackend.variation_attributes. Options
+    without a price in the JSON get `base_price` when it is set.
+    """
+    # One price per attribute option, a later combination overwrites an earlier one
+    attribute_price_map = {}
+    for variation in variations:
+        if 'display_price' in variation and 'attributes' in variation:
+            for attribute, value in variation['attributes'].items():
+                attribute_price_map.setdefault(attribute_code(attribute), {})[value] = variation['display_price']
+
+    attribute_variations = []
+    for attribute_name, select_name, options in attributes:
+        code = attribute_code(select_name)
+        attribute_options = []
+        for option_value, option_text in options:
+            # Fetch the price from the attribute_price_map if available
+            option_price = attribute_price_map.get(code, {}).get(option_value, 0)
+
+            # If option_price is 0 and the product has a single base price, use the base price
+            if option_price == 0 and base_price > 0:
+                option_price = base_price
+
+            attribute_options.append({
+                'attribute_option_code': option_text,
+                'attribute_option_price': option_price
+            })
+
+        if attribute_options:
+            attribute_variations.append({
+                'attribute_name': attribute_name,
+                'attribute_code': code,
+                'options': attribute_options
+            })
+    return attribute_variations
+
+
+def build_variation_matrix(variations):
+    """Turn the variations JSON of a product into a matrix of attribute combinations.
+
+    Returns {'attributes': [codes], 'combinations': [...]}, where each
+    combination has its 'options' (one per attribute, '' for "any"), 'price'
+    and 'special_price' (as in product records), 'sku', 'in_stock',
+    'stock_quantity' (None when stock isn't managed) and 'variation_id'.
+    """
+    attributes = []
+    for variation in variations:
+        for attribute in variation.get('attributes', {}):
+            if attribute_code(attribute) not in attributes:
+                attributes.append(attribute_code(attribute))
+
+    combinations = []
+    for variation in variations:
+        if 'display_price' not in variation or 'attributes' not in variation:
+            continue
+
+        options = {attribute_code(attribute): value for attribute, value in variation['attributes'].items()}
+        current_price = variation['display_price']
+        regular_price = variation.get('display_regular_price', current_price)
+        combinations.append({
+            'options': [options.get(code, '') for code in attributes],
+            'price': regular_price,
+            'special_price': current_price if current_price < regular_price else 0,
+            'sku': variation.get('sku', ''),
+            'in_stock': variation.get('is_in_stock', True),
+            'stock_quantity': variation.get('max_qty') or None,
+            'variation_id': variation.get('variation_id'),
+        })
+
+    return {'attributes': attributes, 'combinations': combinations}
+
+
+class ParserBackend:
+    """Extraction logic for listing, product and category pages.
+
+    The extractors are written once against a handful of node operations
+    (CSS select, text, attributes, HTML serialization) that every backend
+    implements on top of its own parser library.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.compiled_specs = {}
+
+    # Node operations, implemented by each backend
+
+    def parse(self, html):
+        raise NotImplementedError
+
+    def parse_product_page(self, html):
+        """Parse a product page for the product extractors, the whole page unless a backend can do less."""
+        return self.parse(html)
+
+    def compile_selector(self, selector):
+        """Compile a CSS selector into a (select_first, select_all) pair of callables taking a node."""
+        raise NotImplementedError
+
+    def select_one(self, node, selector):
+        return self.compile_selector(selector)[0](node)
+
+    def select(self, node, selector):
+        return self.compile_selector(selector)[1](node)
+
+    def children(self, node):
+        """Element children of a node, without text or comments."""
+        raise NotImplementedError
+
+    def tag_name(self, node):
+        raise NotImplementedError
+
+    def text(self, node):
+        raise NotImplementedError
+
+    def spaced_text(self, node):
+        """Text of a node with its stripped text pieces joined by single spaces."""
+        raise NotImplementedError
+
+    def attr(self, node, name):
+        raise NotImplementedError
+
+    def outer_html(self, node):
+        raise NotImplementedError
+
+    def inner_html(self, node):
+        raise NotImplementedError
+
+    # Extractors
+
+    def has_classes(self, node, *classes):
+        node_classes = (self.attr(node, 'class') or '').split()
+        return all(cls in node_classes for cls in classes)
+
+    def extract(self, root, fields, product_url=None, record=None):
+        """Extract the fields of a spec from a parsed node, compiling the spec on first use."""
+        extractor = self.compiled_specs.get(fields)
+        if extractor is None:
+            extractor = self.compiled_specs[fields] = compile_fields(self, fields)
+        return extractor(root, product_url, record)
+
+    def parse_fields(self, html, fields=PRODUCT_FIELDS, product_url=None):
+        """Extract the fields of a spec from a product page."""
+        return self.extract(self.parse_product_page(html), fields, product_url)
+
+    def parse_prices(self, html):
+        """Read the price and special price of a product page."""
+        return self.parse_fields(html, PRICE_FIELDS)
+
+    def parse_product(self, html, product_id, product_url=None, fields=PRODUCT_FIELDS):
+        """Extract a product record from a product detail page."""
+        return {'product_id': product_id, **self.parse_fields(html, fields, product_url)}
+
+    def parse_product_jsonld(self, html, product_id, product_url=None, fields=PRODUCT_FIELDS):
+        """Like parse_product, but fields with a `jsonld` reader are taken from the page's JSON-LD.
+
+        The JSON-LD blocks are found by a scan of the raw HTML, the page is
+        only parsed when some fields are left over. Returns (record, names of
+        the fields read from JSON-LD, whether the page had to be parsed).
+        """
+        record = {}
+        jsonld_product = find_jsonld_product(decode_html(html))
+        if jsonld_product:
+            for field in fields:
+                if field.jsonld:
+                    value = field.jsonld(jsonld_product)
+                    if value is not MISSING:
+                        record[field.name] = value
+        from_jsonld = tuple(record)
+
+        remaining_fields = tuple(field for field in fields if field.name not in record)
+        if remaining_fields:
+            self.extract(self.parse_product_page(html), remaining_fields, product_url, record)
+
+        # Same key order as parse_product
+        product = {'product_id': product_id, **{field.name: record[field.name] for field in fields if field.name in record}}
+        return product, from_jsonld, bool(remaining_fields)
+
+    def load_variations(self, variation_form, product_url=None, report_errors=True):
+        """The parsed data-product_variations JSON of a variations form, [] if it has none."""
+        variations_data = self.attr(variation_form, 'data-product_variations')
+        if not variations_data:
+            return []
+        try:
+            return load_variations_json(variations_data)
+        except json.JSONDecodeError as e:
+            if report_errors:
+                print(f"Error parsing variations data for {product_url}: {e}")
+            return []
+
+    def parse_variations(self, root, variation_form, style, base_price=0, product_url=None):
+        """Read the variations of a configurable product.
+
+        style 'matrix' returns every attribute combination with its prices, SKU
+        and stock, see build_variation_matrix. 'codes' lists each variation's
+        'ma-san-pham' code and price (v3/v4 shape). 'options' lists the options
+        of every attribute with their price (v5 shape), and
+        'options_or_base_price' falls back to the base price for options
+        without one (v6 shape). 'lookup' returns what is needed to resolve the
+        variations over AJAX when the form has no JSON, or None when it has.
+        """
+        if style == 'lookup':
+            return self.variation_lookup(root, variation_form)
+
+        variations = self.load_variations(variation_form, product_url, report_errors=style != 'matrix')
+        if style == 'matrix':
+            return build_variation_matrix(variations)
+        if style == 'codes':
+            return [{
+                'variation_code': variation['attributes'].get('attribute_pa_ma-san-pham', ''),
+                'variation_price': f"{variation['display_price']}₫"
+            } for variation in variations if 'display_price' in variation and 'attributes' in variation]
+
+        use_base_price = style == 'options_or_base_price'
+        return attribute_option_variations(variations, list(self.variation_attributes(root)), base_price if use_base_price else 0)
+
+    def variation_attributes(self, root):
+        """Yield [attribute_name, select_name, [[option_value, option_text], ...]] for each attribute select.
+
+        Only the display names come from the HTML, the JSON has attribute and
+        option slugs only.
+        """
+        labels = {self.attr(label, 'for'): self.text(label).strip() for label in self.select(root, 'table.variations label')}
+        for select in self.select(root, 'table.variations select'):
+            attribute_name = labels.get(self.attr(select, 'id'))
+            if attribute_name is None:
+                continue
+
+            # Skip the default option with an empty value
+            options = [[self.attr(option, 'value'), self.text(option).strip()] for option in self.select(select, 'option') if self.attr(option, 'value')]
+            yield [attribute_name, self.attr(select, 'name') or '', options]
+
+    def variation_lookup(self, root, variation_form):
+        """The product ID and attribute options of a form whose variations are only available over AJAX.
+
+        WooCommerce leaves data-product_variations at "false" once a product
+        has more variations than its AJAX threshold.
+        """
+        if self.attr(variation_form, 'data-product_variations') != 'false':
+            return None
+        # The whole displayed range, the base price alone is only its minimum
+        price_block = self.select_one(root, PRICE_BLOCK)
+        return {
+            'product_id': self.attr(variation_form, 'data-product_id'),
+            'attributes': list(self.variation_attributes(root)),
+            'price_text': self.spaced_text(price_block) if price_block is not None else '',
+        }
+
+    def get_last_page_number(self, root):
+        """Read the highest page number from the pagination block, or None if there is none."""
+        page_numbers = []
+        for page_tag in self.select(root, 'a.page-number, a.page-numbers, span.page-number, span.page-numbers'):
+            # Next/previous arrows carry an icon instead of a number and are skipped
+            page_text = self.text(page_tag).strip().replace('.', '').replace(',', '')
+            if page_text.isdigit():
+                page_numbers.append(int(page_text))
+
+        return max(page_numbers) if page_numbers else None
+
+    def parse_listing(self, html, start_product_id, fields=LISTING_TILE_FIELDS):
+        """Extract product tiles, the next page link and the last page number from a listing page.
+
+        Returns (products, next_page_url, next_product_id, last_page). With a
+        `start_product_id` of None the tiles get no product ID.
+        """
+        root = self.parse(html)
+
+        # Find the main product list container
+        products_container = self.select_one(root, 'div.products')
+        if products_container is None:
+            return [], None, start_product_id, None
+
+        products = []
+        product_id = start_product_id  # Initialize product ID for this page
+
+        # Iterate over each product block
+        for product_item in self.children(products_container):
+            if self.tag_name(product_item) != 'div' or not self.has_classes(product_item, 'product-small'):
+                continue
+
+            product_data = self.extract(product_item, fields)
+            if 'product_url' not in product_data:
+                continue
+
+            if product_id is None:
+                products.append(product_data)
+                continue
+
+            products.append({'product_id': product_id, **product_data})
+            product_id += 1  # Increment product ID
+
+        # Check for pagination and next page
+        next_page_link = self.select_one(root, 'a.next.page-number')
+        next_page_url = self.attr(next_page_link, 'href') if next_page_link is not None else None
+
+        return products, next_page_url, product_id, self.get_last_page_number(root)
+
+    def parse_category(self, category_tag):
+        """Recursively read a category list item and its subcategories."""
+        category_link = self.select_one(category_tag, 'a')
+        category_data = {
+            'name': self.text(category_link).strip(),
+            'url': self.attr(category_link, 'href'),
+            'children': []
+        }
+
+        children = self.select_one(category_tag, 'ul.children')
+        if children is not None:
+            for child in self.children(children):
+                if self.tag_name(child) == 'li':
+                    category_data['children'].append(self.parse_category(child))
+
+        # If there are no subcategories, remove 'children' key to keep the structure clean
+        if not category_data['children']:
+            del category_data['children']
+
+        return category_data
+
+    def parse_categories(self, html):
+        """Read the nested product category widget of a shop page."""
+        root = self.parse(html)
+        category_list = self.select_one(root, 'ul.product-categories')
+        if category_list is None:
+            return []
+        return [self.parse_category(item) for item in self.children(category_list) if self.tag_name(item) == 'li']
+
+
+class Bs4Backend(ParserBackend):
+    """BeautifulSoup with the pure-Python html.parser, the original extraction path."""
+
+    name = 'bs4'
+
+    def __init__(self, features='html.parser'):
+        super().__init__()
+        self.features = features
+
+    def parse(self, html):
+        return BeautifulSoup(html, self.features)
+
+    def compile_selector(self, selector):
+        compiled = soupsieve.compile(selector)
+        return compiled.select_one, compiled.select
+
+    def select_one(self, node, selector):
+        return node.select_one(selector)
+
+    def select(self, node, selector):
+        return node.select(selector)
+
+    def children(self, node):
+        return node.find_all(True, recursive=False)
+
+    def tag_name(self, node):
+        return node.name
+
+    def text(self, node):
+        return node.get_text()
+
+    def spaced_text(self, node):
+        return node.get_text(' ', strip=True)
+
+    def attr(self, node, name):
+        value = node.get(name)
+        # class and rel are multi-valued in BeautifulSoup
+        return ' '.join(value) if isinstance(value, list) else value
+
+    def outer_html(self, node):
+        return str(node)
+
+    def inner_html(self, node):
+        return node.decode_contents()
+
+
+class Bs4PartialBackend(Bs4Backend):
+    """Like bs4, but product pages only get a tree for the regions in PRODUCT_REGIONS.
+
+    Every field of the product specs in extraction.py lives in one of those
+    regions, a new field outside them needs a new region too.
+    """
+
+    name = 'bs4-partial'
+
+    def parse_product_page(self, html):
+        return BeautifulSoup(html, self.features, parse_only=ProductRegionStrainer())
+
+
+class LxmlBackend(ParserBackend):
+    """lxml.html with cssselect, requires `pip install lxml cssselect`."""
+
+    name = 'lxml'
+
+    def __init__(self):
+        try:
+            import lxml.html
+            from lxml.cssselect import CSSSelector
+        except ImportError as err:
+            raise ImportError("The lxml parser backend needs `pip install lxml cssselect`") from err
+        super().__init__()
+        self.lxml_html = lxml.html
+        self.css_selector = CSSSelector
+        self.compiled = {}
+
+    def compile(self, selector):
+        if selector not in self.compiled:
+            self.compiled[selector] = self.css_selector(selector)
+        return self.compiled[selector]
+
+    def compile_selector(self, selector):
+        matcher = self.compile(selector)
+
+        def select_first(node):
+            matches = matcher(node)
+            return matches[0] if matches else None
+
+        return select_first, matcher
+
+    def parse(self, html):
+        return self.lxml_html.document_fromstring(decode_html(html))
+
+    def select_one(self, node, selector):
+        matches = self.compile(selector)(node)
+        return matches[0] if matches else None
+
+    def select(self, node, selector):
+        return self.compile(selector)(node)
+
+    def children(self, node):
+        # Comments and processing instructions have a non-string tag
+        return [child for child in node if isinstance(child.tag, str)]
+
+    def tag_name(self, node):
+        return node.tag
+
+    def text(self, node):
+        return node.text_content()
+
+    def spaced_text(self, node):
+        return ' '.join(piece.strip() for piece in node.itertext() if piece.strip())
+
+    def attr(self, node, name):
+        return node.get(name)
+
+    def outer_html(self, node):
+        return self.lxml_html.tostring(node, encoding='unicode', with_tail=False)
+
+    def inner_html(self, node):
+        inner = html_lib.escape(node.text, quote=False) if node.text else ''
+        return inner + ''.join(self.lxml_html.tostring(child, encoding='unicode') for child in node)
+
+
+class SelectolaxBackend(ParserBackend):
+    """selectolax on the lexbor engine, requires `pip install selectolax`."""
+
+    name = 'selectolax'
+
+    def __init__(self):
+        try:
+            from selectolax.lexbor import LexborHTMLParser
+        except ImportError as err:
+            raise ImportError("The selectolax parser backend needs `pip install selectolax`") from err
+        super().__init__()
+        self.parser_class = LexborHTMLParser
+
+    def parse(self, html):
+        return self.parser_class(decode_html(html))
+
+    def compile_selector(self, selector):
+        # lexbor caches compiled selectors itself
+        return (lambda node: node.css_first(selector)), (lambda node: node.css(selector))
+
+    def select_one(self, node, selector):
+        return node.css_first(selector)
+
+    def select(self, node, selector):
+        return node.css(selector)
+
+    def children(self, node):
+        # Text and comment nodes are tagged '-text', '-comment'
+        return [child for child in node.iter() if not child.tag.startswith('-')]
+
+    def tag_name(self, node):
+        return node.tag
+
+    def text(self, node):
+        return node.text(deep=True)
+
+    def spaced_text(self, node):
+        return node.text(deep=True, separator=' ', strip=True)
+
+    def attr(self, node, name):
+        return node.attributes.get(name)
+
+    def outer_html(self, node):
+        return node.html
+
+    def inner_html(self, node):
+        return node.inner_html
+
+
+PARSER_BACKENDS = {
+    'bs4': Bs4Backend,
+    'bs4-partial': Bs4PartialBackend,
+    'lxml': LxmlBackend,
+    'selectolax': SelectolaxBackend,
+}
+
+_backend_instances = {}
+
+
+def get_backend(name='bs4'):
+    """Return the parser backend with the given name ('bs4', 'lxml' or 'selectolax')."""
+    if isinstance(name, ParserBackend):
+        return name
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend {name!r}, choose from {', '.join(PARSER_BACKENDS)}")
+    if name not in _backend_instances:
+        _backend_instances[name] = PARSER_BACKENDS[name]()
+    return _backend_instances[name]
+
+
+def run_extractor(parser, method, *args):
+    """Run one extractor of a backend by name, returning plain dicts/lists.
+
+    This is also the entry point of the parse worker processes, so it only
+    takes and returns picklable values.
+    """
+    return getattr(get_backend(parser), method)(*args)
+
+
+class ParsePool:
+    """Runs the extractors in worker processes, off the event loop.
+
+    Only the raw HTML goes to a worker and only the extracted record comes
+    back, so parsing scales with cores while fetching stays on the loop.
+    """
+
+    def __init__(self, parser='bs4', max_workers=None):
+        self.parser = parser
+        self.name = get_backend(parser).name  # Fail early if the backend isn't installed
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    async def run(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, run_extractor, self.parser, method, *args)
+
+    def describe(self):
+        return f"{self.name} backend in {self.max_workers} worker processes"
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+async def extract(parser, method, *args):
+    """Run an extractor inline when `parser` is a backend name, else through its run().
+
+    ParsePool runs it in the worker processes, template_slicing.TemplateSlicer
+    hands it a slice of the page first.
+    """
+    if isinstance(parser, str):
+        return run_extractor(parser, method, *args)
+    return await parser.run(method, *args)
+
+
+def canonical_html(fragment):
+    """Re-serialize an HTML fragment so output from different serializers can be compared."""
+    return str(BeautifulSoup(fragment, 'html.parser'))
+
+
+def canonical_record(record):
+    """Canonicalize the HTML fields of a record for a parity comparison."""
+    return {
+        key: canonical_html(value) if key in ('description', 'short_description') and value else value
+        for key, value in record.items()
+    }
+
+
+def check_parity(html, kind='product', backends=None):
+    """Run every backend over one page and return {backend: [differing fields]} against bs4.
+
+    HTML fields are compared after canonicalization, since each library
+    serializes attributes and void elements its own way.
+    """
+    backends = [get_backend(name) for name in (backends or PARSER_BACKENDS)]
+    reference = get_backend('bs4')
+
+    def extract(backend):
+        if kind == 'listing':
+            return backend.parse_listing(html, 1)
+        if kind == 'categories':
+            return backend.parse_categories(html)
+        return canonical_record(backend.parse_product(html, 1))
+
+    expected = extract(reference)
+    mismatches = {}
+    for backend in backends:
+        result = extract(backend)
+        if kind == 'product':
+            differing = sorted(key for key in set(expected) | set(result) if expected.get(key) != result.get(key))
+        else:
+            differing = [] if result == expected else [kind]
+        if differing:
+            mismatches[backend.name] = differing
+    return mismatches
+
+
+def measure_partial_parsing(html, runs=20):
+    """Compare parse time and peak memory of a full and a region-limited parse of one product page.
+
+    Returns {'full': {...}, 'partial': {...}, 'identical': bool}, where each
+    side has the average parse time in ms and the peak traced memory in KB.
+    """
+    html = decode_html(html)
+    results = {}
+    records = {}
+    for name in ('bs4', 'bs4-partial'):
+        backend = get_backend(name)
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            backend.parse_product_page(html)
+        parse_ms = (time.perf_counter() - start) / runs * 1000
+
+        tracemalloc.start()
+        records[name] = backend.parse_product(html, 1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results['full' if name == 'bs4' else 'partial'] = {'parse_ms': parse_ms, 'peak_kb': peak / 1024}
+
+    results['identical'] = records['bs4'] == records['bs4-partial']
+    return results
+
+
+if __name__ == "__main__":
+    import requests
+
+    arg_parser = argparse.ArgumentParser(description="Check that every parser backend extracts identical records.")
+    arg_parser.add_argument('pages', nargs='+', help="Product/listing page URLs or saved HTML files")
+    arg_parser.add_argument('--kind', choices=['product', 'listing', 'categories'], default='product')
+    arg_parser.add_argument('--backends', nargs='+', choices=list(PARSER_BACKENDS), default=list(PARSER_BACKENDS))
+    arg_parser.add_argument('--measure', action='store_true', help="Measure full vs region-limited parsing of product pages instead")
+    args = arg_parser.parse_args()
+
+    failures = 0
+    for page in args.pages:
+        if page.startswith(('http://', 'https://')):
+            page_html = requests.get(page).text
+        else:
+            with open(page, 'r', encoding='utf-8') as page_file:
+                page_html = page_file.read()
+
+        if args.measure:
+            measurement = measure_partial_parsing(page_html)
+            full, partial = measurement['full'], measurement['partial']
+            print(f"{page}: parse {full['parse_ms']:.2f} -> {partial['parse_ms']:.2f} ms, "
+                  f"peak memory {full['peak_kb']:.0f} -> {partial['peak_kb']:.0f} KB, "
+                  f"{'identical' if measurement['identical'] else 'DIFFERENT'} record")
+            failures += not measurement['identical']
+            continue
+
+        mismatches = check_parity(page_html, args.kind, args.backends)
+        if mismatches:
+            failures += 1
+            print(f"MISMATCH {page}: {mismatches}")
+        else:
+            print(f"OK {page}")
+
+    if args.measure:
+        print(f"{len(args.pages) - failures}/{len(args.pages)} pages extract the same record from the partial parse")
+    else:
+        print(f"{len(args.pages) - failures}/{len(args.pages)} pages identical across {', '.join(args.backends)}")
@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+from tqdm import tqdm
+
+from catalog import AmbiguousSku, CatalogStore, is_catalog_path
+from extraction import PRODUCT_FIELDS, select_fields
+from http_cache import HttpCache
+from parsers import get_backend
+from retry import RetryPolicy
+from sanitize import HtmlSanitizer
+from scheduler import CrawlScheduler
+from sitemap import iter_sitemap_products
+from v6 import fetch_url, get_max_workers
+
+# Fields read and patched by each refresh mode. The SKU is read too, it
+# matches the page to its record in datasets written before records kept
+# their product URL.
+REFRESH_FIELDS = {
+    'prices': ('price', 'special_price'),
+    'descriptions': ('description', 'short_description'),
+}
+
+
+def load_dataset(dataset_path):
+    with open(dataset_path, 'r', encoding='utf-8') as dataset_file:
+        return json.load(dataset_file)
+
+
+def save_dataset(products, dataset_path):
+    """Write the dataset back atomically, in the layout of convert_csv_to_json.py."""
+    temp_path = f"{dataset_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as dataset_file:
+        json.dump(products, dataset_file, ensure_ascii=False, indent=2)
+    os.replace(temp_path, dataset_path)
+
+
+def read_url_list(urls_path):
+    """Read product URLs, one per line, skipping blank lines and # comments."""
+    with open(urls_path, 'r', encoding='utf-8') as urls_file:
+        return [line.strip() for line in urls_file if line.strip() and not line.startswith('#')]
+
+
+async def fetch_fields(urls, session, fields, parser='bs4-partial', **fetch_options):
+    """Fetch product pages concurrently and extract only `fields` (plus the SKU) from each.
+
+    Returns {url: record} for the pages that could be fetched.
+    """
+    spec = select_fields(PRODUCT_FIELDS, 'product_sku', *fields)
+    backend = get_backend(parser)
+
+    async def fetch_one(url):
+        html = await fetch_url(url, session, **fetch_options)
+        return url, backend.parse_fields(html, spec, url) if html else None
+
+    results = {}
+    tasks = [fetch_one(url) for url in urls]
+    for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Refreshing Products", unit="product"):
+        url, record = await task
+        if record:
+            results[url] = record
+    return results
+
+
+def patch_products(products, refreshed, fields):
+    """Patch the refreshed fields into the matching records in place.
+
+    Records are matched on 'product_url' when the dataset has it, otherwise
+    on 'product_sku'. SKUs are made from product names and aren't unique, a
+    SKU shared by several records patches none of them. Returns (patched,
+    changed, unmatched_urls, ambiguous_urls).
+    """
+    by_url = {}
+    by_sku = {}
+    for product in products:
+        if product.get('product_url'):
+            by_url.setdefault(product['product_url'], []).append(product)
+        if product.get('product_sku'):
+            by_sku.setdefault(product['product_sku'], []).append(product)
+
+    patched = 0
+    changed = 0
+    unmatched_urls = []
+    ambiguous_urls = []
+    for url, record in refreshed.items():
+        matches = by_url.get(url)
+        if not matches:
+            matches = by_sku.get(record.get('product_sku'), [])
+            if len(matches) > 1:
+                ambiguous_urls.append(url)
+                continue
+        if not matches:
+            unmatched_urls.append(url)
+            continue
+
+        for product in matches:
+            patched += 1
+            updates = {field: record[field] for field in fields if field in record}
+            if any(product.get(field) != value for field, value in updates.items()):
+                changed += 1
+            product.update(updates)
+
+    return patched, changed, unmatched_urls, ambiguous_urls
+
+
+def patch_catalog(catalog, refreshed, fields):
+    """patch_products for a CatalogStore, one indexed update per page instead of rewriting a file."""
+    patched = 0
+    changed = 0
+    unmatched_urls = []
+    ambiguous_urls = []
+    for url, record in refreshed.items():
+        updates = {field: record[field] for field in fields if field in record}
+        try:
+            matched, record_changed = catalog.patch(url, record.get('product_sku'), updates)
+        except AmbiguousSku:
+            ambiguous_urls.append(url)
+            continue
+        if not matched:
+            unmatched_urls.append(url)
+        patched += matched
+        changed += record_changed
+    return patched, changed, unmatched_urls, ambiguous_urls
+
+
+async def discover_urls(sitemap_url, session, **fetch_options):
+    urls = []
+    async for products in iter_sitemap_products(sitemap_url, session, **fetch_options):
+        urls.extend(product['product_url'] for product in products)
+    return urls
+
+
+async def refresh_dataset(dataset_path, mode='prices', urls=None, sitemap_url=None, max_workers=None, parser='bs4-partial', cache_dir=None, max_attempts=4, sanitize_html=True):
+    """Refresh one group of fields of a products.json or a catalog.db in place, without a full crawl.
+
+    Product URLs come from `urls`, else from the records' 'product_url',
+    else from the product sitemap at `sitemap_url`. Only the product pages are
+    fetched, over one pooled session, and only the fields of `mode` are
+    extracted and written back. With `sanitize_html`, refreshed descriptions
+    are cleaned the same way as in a v6 crawl. A SQLite catalog (see
+    catalog.CatalogStore) is patched row by row instead of being rewritten.
+    """
+    start_time = time.time()
+    fields = REFRESH_FIELDS[mode]
+    catalog = CatalogStore(dataset_path) if is_catalog_path(dataset_path) else None
+    products = load_dataset(dataset_path) if not catalog else None
+
+    if not urls:
+        urls = catalog.product_urls() if catalog else [product['product_url'] for product in products if product.get('product_url')]
+
+    scheduler = CrawlScheduler(max_workers or get_max_workers(), adaptive=True)
+    cache = HttpCache(cache_dir) if cache_dir else None
+    retry = RetryPolicy(max_attempts=max_attempts)
+
+    async with aiohttp.ClientSession(connector=scheduler.make_connector()) as session:
+        if not urls and sitemap_url:
+            print(f"Dataset has no product URLs, reading them from {sitemap_url}...")
+            urls = await discover_urls(sitemap_url, session, scheduler=scheduler, retry=retry)
+        if not urls:
+            raise SystemExit("No product URLs to refresh, pass a URL list or a sitemap")
+
+        print(f"Refreshing {mode} of {len(urls)} products with {scheduler.describe()}...")
+        try:
+            refreshed = await fetch_fields(urls, session, fields, parser, scheduler=scheduler, cache=cache, retry=retry)
+        finally:
+            if cache:
+                cache.save()
+
+    sanitizer = HtmlSanitizer(fields) if sanitize_html else None
+    if sanitizer:
+        for record in refreshed.values():
+            sanitizer.sanitize_record(record)
+
+    if catalog:
+        patched, changed, unmatched_urls, ambiguous_urls = patch_catalog(catalog, refreshed, fields)
+        catalog.close()
+    else:
+        patched, changed, unmatched_urls, ambiguous_urls = patch_products(products, refreshed, fields)
+        save_dataset(products, dataset_path)
+
+    scheduler.report()
+    retry.report()
+    if cache:
+        cache.report()
+    if sanitizer and sanitizer.sanitized:
+        sanitizer.report()
+    print(f"Fetched {len(refreshed)}/{len(urls)} pages, patched {patched} records ({changed} changed) in {dataset_path}")
+    if unmatched_urls:
+        print(f"{len(unmatched_urls)} pages matched no record, e.g. {unmatched_urls[0]}")
+    if ambiguous_urls:
+        print(f"{len(ambiguous_urls)} pages were skipped, their SKU matches several records without a product URL, e.g. {ambiguous_urls[0]}")
+    print(f"Refresh completed in {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Refresh prices or descriptions of an existing products.json in place.")
+    arg_parser.add_argument('mode', choices=list(REFRESH_FIELDS))
+    arg_parser.add_argument('--dataset', default='products.json', help="products.json, or a SQLite catalog such as catalog.db")
+    arg_parser.add_argument('--urls', help="File with one product URL per line (default: the dataset's product_url fields)")
+    arg_parser.add_argument('--sitemap', help="Sitemap to read product URLs from when the dataset has none, e.g. https://tinnha.vn/sitemap_index.xml")
+    arg_parser.add_argument('--max-workers', type=int)
+    arg_parser.add_argument('--parser', default='bs4-partial')
+    arg_parser.add_argument('--cache-dir')
+    arg_parser.add_argument('--keep-raw-html', action='store_true', help="Don't strip Google Sheets attributes and other non-rendering markup from descriptions")
+    args = arg_parser.parse_args()
+
+    asyncio.run(refresh_dataset(
+        args.dataset,
+        args.mode,
+        urls=read_url_list(args.urls) if args.urls else None,
+        sitemap_url=args.sitemap,
+        max_workers=args.max_workers,
+        parser=args.parser,
+        cache_dir=args.cache_dir,
+        sanitize_html=not args.keep_raw_html,
+    ))
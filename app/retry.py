@@ -0,0 +1,134 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import aiohttp
+
+# Statuses worth asking again for, anything else (404, 403, ...) is fatal
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(err):
+    """Classify a request error as transient (retry) or fatal (give up at once)."""
+    if isinstance(err, aiohttp.ClientResponseError):
+        return err.status in RETRYABLE_STATUSES
+    return isinstance(err, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """Pause requests to a host after too many consecutive failures."""
+
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self):
+        """Count a failure, returns True when this failure opens the circuit."""
+        self.failures += 1
+        if self.failures >= self.failure_threshold and time.time() >= self.open_until:
+            self.open_until = time.time() + self.cooldown
+            return True
+        return False
+
+    def remaining(self):
+        return max(self.open_until - time.time(), 0.0)
+
+
+class RetryPolicy:
+    """Retry transient request errors with capped exponential backoff and full jitter.
+
+    Retry-After from the server wins over the computed delay, and each host
+    gets a circuit breaker so a struggling server is paused rather than hammered.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=30.0, failure_threshold=5, cooldown=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.breakers = {}
+
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self.circuit_opens = 0
+        self.failed_urls = []
+
+    def breaker_for(self, url):
+        host = urlparse(url).netloc
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.failure_threshold, self.cooldown)
+        return self.breakers[host]
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Delay before the given retry attempt (1-based)."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def sleep(self, seconds):
+        self.backoff_seconds += seconds
+        await asyncio.sleep(seconds)
+
+    async def run(self, url, request):
+        """Await `request()` until it succeeds, fails fatally or runs out of attempts."""
+        breaker = self.breaker_for(url)
+        attempt = 1
+        while True:
+            # Wait out an open circuit instead of sending more requests to the host
+            if breaker.remaining():
+                await self.sleep(breaker.remaining())
+
+            try:
+                result = await request()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                if not is_retryable(err):
+                    self.failed_urls.append(url)
+                    raise
+
+                if breaker.record_failure():
+                    self.circuit_opens += 1
+                    print(f"\nToo many failures on {urlparse(url).netloc}, pausing it for {self.cooldown:.0f} seconds")
+
+                if attempt >= self.max_attempts:
+                    self.failed_urls.append(url)
+                    raise
+
+                retry_after = None
+                if isinstance(err, aiohttp.ClientResponseError) and err.headers:
+                    retry_after = parse_retry_after(err.headers.get('Retry-After'))
+                self.retries += 1
+                await self.sleep(self.backoff_delay(attempt, retry_after))
+                attempt += 1
+                continue
+
+            breaker.record_success()
+            return result
+
+    def report(self):
+        print(f"Retries: {self.retries} retried requests, {self.backoff_seconds:.2f} seconds spent backing off, "
+              f"{self.circuit_opens} circuit breaker pauses")
+        if self.failed_urls:
+            print(f"Gave up on {len(self.failed_urls)} URLs:")
+            for url in self.failed_urls:
+                print(f"  {url}")
@@ -0,0 +1,150 @@
+import html as html_lib
+from html.parser import HTMLParser
+
+# Attributes that only carry editor state, Google Sheets pastes put the whole cell in them
+JUNK_ATTRIBUTE_PREFIXES = ('data-sheets-', 'data-mce-')
+
+# Attributes dropped when they are empty
+EMPTY_JUNK_ATTRIBUTES = {'style', 'class', 'id', 'dir'}
+
+# Elements dropped together with their content
+JUNK_ELEMENTS = {'script', 'noscript', 'meta', 'link'}
+
+# Record fields holding HTML from the shop's editor
+HTML_FIELDS = ('description', 'short_description')
+
+# Size of the pieces sanitize_html feeds the parser with
+SANITIZE_CHUNK_SIZE = 16 * 1024
+
+
+def is_junk_attribute(name, value):
+    return name.startswith(JUNK_ATTRIBUTE_PREFIXES) or (name in EMPTY_JUNK_ATTRIBUTES and not (value or '').strip())
+
+
+class SanitizingParser(HTMLParser):
+    """Rewrite HTML as it is fed, without the markup that doesn't render.
+
+    Drops comments, editor-state attributes (JUNK_ATTRIBUTE_PREFIXES), empty
+    style/class attributes, script-like elements, Office namespace tags such
+    as <o:p> (their text is kept) and the <span> wrappers left without any
+    attribute. Everything else, entities included, is written back as is.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.output = []
+        self.skip_depth = 0
+        self.span_stack = []
+
+    def drain(self):
+        cleaned = ''.join(self.output)
+        self.output.clear()
+        return cleaned
+
+    def emit(self, text):
+        if not self.skip_depth:
+            self.output.append(text)
+
+    def format_start_tag(self, tag, attrs, self_closing):
+        cleaned_attrs = [(name, value) for name, value in attrs if not is_junk_attribute(name, value)]
+        if len(cleaned_attrs) == len(attrs):
+            return self.get_starttag_text()
+        parts = [tag]
+        for name, value in cleaned_attrs:
+            parts.append(name if value is None else f'{name}="{html_lib.escape(value)}"')
+        return f"<{' '.join(parts)}{' /' if self_closing else ''}>"
+
+    def handle_starttag(self, tag, attrs):
+        if tag in JUNK_ELEMENTS:
+            if tag in ('script', 'noscript'):
+                self.skip_depth += 1
+            return
+        if ':' in tag:
+            return
+        if tag == 'span':
+            unwrapped = all(is_junk_attribute(name, value) for name, value in attrs)
+            self.span_stack.append(unwrapped)
+            if unwrapped:
+                return
+        self.emit(self.format_start_tag(tag, attrs, False))
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in JUNK_ELEMENTS or ':' in tag:
+            return
+        self.emit(self.format_start_tag(tag, attrs, True))
+
+    def handle_endtag(self, tag):
+        if tag in JUNK_ELEMENTS:
+            if tag in ('script', 'noscript') and self.skip_depth:
+                self.skip_depth -= 1
+            return
+        if ':' in tag:
+            return
+        if tag == 'span' and self.span_stack and self.span_stack.pop():
+            return
+        self.emit(f'</{tag}>')
+
+    def handle_data(self, data):
+        self.emit(data)
+
+    def handle_entityref(self, name):
+        self.emit(f'&{name};')
+
+    def handle_charref(self, name):
+        self.emit(f'&#{name};')
+
+    def handle_comment(self, data):
+        pass
+
+    def handle_decl(self, decl):
+        self.emit(f'<!{decl}>')
+
+    def unknown_decl(self, data):
+        self.emit(f'<![{data}]>')
+
+
+def iter_sanitized(chunks):
+    """Sanitize HTML arriving in pieces, yielding the cleaned HTML as it becomes available."""
+    parser = SanitizingParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        cleaned = parser.drain()
+        if cleaned:
+            yield cleaned
+    parser.close()
+    cleaned = parser.drain()
+    if cleaned:
+        yield cleaned
+
+
+def sanitize_html(html):
+    """The HTML without the markup that doesn't render, see SanitizingParser."""
+    chunks = (html[start:start + SANITIZE_CHUNK_SIZE] for start in range(0, len(html), SANITIZE_CHUNK_SIZE))
+    return ''.join(iter_sanitized(chunks))
+
+
+class HtmlSanitizer:
+    """Sanitizes the HTML fields of records and keeps count of the bytes saved over a run."""
+
+    def __init__(self, fields=HTML_FIELDS):
+        self.fields = fields
+        self.sanitized = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def sanitize_record(self, record):
+        for field in self.fields:
+            value = record.get(field)
+            if not isinstance(value, str) or not value:
+                continue
+            cleaned = sanitize_html(value)
+            record[field] = cleaned
+            self.sanitized += 1
+            self.bytes_before += len(value.encode('utf-8'))
+            self.bytes_after += len(cleaned.encode('utf-8'))
+        return record
+
+    def report(self):
+        saved = self.bytes_before - self.bytes_after
+        share = saved / self.bytes_before if self.bytes_before else 0
+        print(f"HTML sanitizer: {self.sanitized} fields cleaned, {saved / 1024:.1f} KB saved ({share:.0%} of {self.bytes_before / 1024:.1f} KB)")
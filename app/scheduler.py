@@ -0,0 +1,152 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+
+import aiohttp
+
+# Responses that mean the server wants us to slow down
+THROTTLE_STATUSES = {429, 503}
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit driven by response latency and throttling responses.
+
+    The limit grows by one for every full round of requests whose p95 latency
+    stays under `target_latency`, and is cut by `backoff_factor` on a 429/503,
+    a timeout or a latency spike.
+    """
+
+    def __init__(self, max_limit, min_limit=1, initial_limit=None, target_latency=1.5,
+                 spike_factor=3.0, backoff_factor=0.5, window=50):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = min(max(initial_limit or 4, self.min_limit), max_limit)
+        self.target_latency = target_latency
+        self.spike_factor = spike_factor
+        self.backoff_factor = backoff_factor
+
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.latencies = deque(maxlen=window)
+        self.samples_since_change = 0
+        self.last_decrease = 0.0
+
+        self.peak_limit = self.limit
+        self.increases = 0
+        self.decreases = 0
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            # Wake everyone, the limit may have grown by more than the one freed slot
+            self.condition.notify_all()
+
+    def p95_latency(self):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+    def record(self, latency, status=None):
+        """Feed one response into the controller."""
+        if status in THROTTLE_STATUSES or latency > self.spike_factor * self.target_latency:
+            self.decrease()
+            return
+
+        self.latencies.append(latency)
+        self.samples_since_change += 1
+        if self.samples_since_change >= self.limit and self.p95_latency() <= self.target_latency:
+            if self.limit < self.max_limit:
+                self.limit += 1
+                self.increases += 1
+                self.peak_limit = max(self.peak_limit, self.limit)
+            self.samples_since_change = 0
+
+    def decrease(self):
+        """Cut the limit, at most once per target latency so one burst counts once."""
+        now = time.monotonic()
+        if now - self.last_decrease < self.target_latency:
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, int(self.limit * self.backoff_factor))
+        self.samples_since_change = 0
+        self.latencies.clear()
+        self.decreases += 1
+
+
+class CrawlScheduler:
+    """Bounded concurrency for crawler requests.
+
+    A global cap limits every request in flight, and separate caps for HTML
+    pages and image downloads keep a burst of images from starving page fetches.
+    With `adaptive=True` the global cap is an AdaptiveLimiter that moves
+    between 1 and `max_workers` on its own.
+    """
+
+    def __init__(self, max_workers, max_pages=None, max_images=None, adaptive=False, target_latency=1.5):
+        self.max_workers = max_workers
+        self.max_pages = min(max_pages or max_workers, max_workers)
+        self.max_images = min(max_images or max(1, max_workers // 2), max_workers)
+
+        self.limiter = AdaptiveLimiter(max_workers, target_latency=target_latency) if adaptive else None
+        self._global_slots = asyncio.Semaphore(self.max_workers)
+        self._kind_slots = {
+            'html': asyncio.Semaphore(self.max_pages),
+            'image': asyncio.Semaphore(self.max_images),
+        }
+
+    @asynccontextmanager
+    async def slot(self, kind='html'):
+        """Hold one request slot of the given kind ('html' or 'image')."""
+        # Always take the per-kind slot first so the locks are acquired in a fixed order
+        async with self._kind_slots[kind]:
+            if self.limiter is None:
+                async with self._global_slots:
+                    yield
+                return
+
+            await self.limiter.acquire()
+            try:
+                yield
+            except asyncio.TimeoutError:
+                self.limiter.decrease()
+                raise
+            finally:
+                await self.limiter.release()
+
+    def record_response(self, status, latency):
+        """Report a response's status and time to first byte to the adaptive limiter."""
+        if self.limiter:
+            self.limiter.record(latency, status)
+
+    def current_limit(self):
+        return self.limiter.limit if self.limiter else self.max_workers
+
+    def make_connector(self):
+        """Create a TCPConnector whose pool matches the global cap."""
+        return aiohttp.TCPConnector(limit=self.max_workers, limit_per_host=self.max_workers, ttl_dns_cache=300)
+
+    def describe(self):
+        if self.limiter:
+            return f"adaptive concurrency up to {self.max_workers} workers (pages: {self.max_pages}, images: {self.max_images})"
+        return f"{self.max_workers} workers (pages: {self.max_pages}, images: {self.max_images})"
+
+    def report(self):
+        if not self.limiter:
+            return
+        print(f"Concurrency: final limit {self.limiter.limit}, peak {self.limiter.peak_limit} of {self.max_workers} "
+              f"({self.limiter.increases} increases, {self.limiter.decreases} decreases, "
+              f"p95 latency {self.limiter.p95_latency():.2f}s)")
+
+
+def request_slot(scheduler, kind='html'):
+    """Return the scheduler slot for a request, or a no-op context without a scheduler."""
+    if scheduler is None:
+        return nullcontext()
+    return scheduler.slot(kind)
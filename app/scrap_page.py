@@ -1,5 +1,6 @@
 import aiohttp
-from bs4 import BeautifulSoup
+from parsers import get_backend
+from extraction import LEGACY_LISTING_TILE_FIELDS
 import asyncio
 
 async def fetch_url(url, session):
@@ -17,29 +18,7 @@ async def scrape_page(url, session):
     if not html:
         return [], None
 
-    soup = BeautifulSoup(html, 'html.parser')
-    products_container = soup.find('div', class_='products')
-    if not products_container:
-        return [], None
-
-    products = []
-    for product_item in products_container.find_all('div', class_='product-small', recursive=False):
-        product_data = {}
-        
-        # Get product name and URL
-        product_name_tag = product_item.find('p', class_='name product-title woocommerce-loop-product__title')
-        if product_name_tag and product_name_tag.find('a'):
-            product_data['product_url'] = product_name_tag.find('a')['href']
-
-            # Get the image URL
-            product_image_tag = product_item.find('img')
-            if product_image_tag:
-                product_data['image_url'] = product_image_tag['src']
-
-            products.append(product_data)
-
-    next_page_link = soup.find('a', class_='next page-number')
-    next_page_url = next_page_link['href'] if next_page_link else None
+    products, next_page_url, _, _ = get_backend().parse_listing(html, None, LEGACY_LISTING_TILE_FIELDS)
 
     return products, next_page_url
 
@@ -0,0 +1,225 @@
+import ast
+import csv
+import json
+import os
+import re
+import time
+
+# Only standard library imports here, convert_csv_to_json.py imports this
+# module from the repository root as app.sinks.
+
+# Columns of products.csv
+PRODUCT_FIELDNAMES = ['product_id', 'product_name', 'product_sku', 'category', 'price', 'special_price', 'description', 'short_description', 'image_url', 'product_type', 'variations', 'variation_matrix']
+
+
+def to_int(value):
+    """An integer from a number, a digit string or a displayed price, else 0.
+
+    Strings are read like extraction.price_digits reads prices: '.' and ','
+    are both thousands separators ('1.250.000 ₫', '1,090,000 ₫'). Of a price
+    range or a 'regular sale' pair, the first price is taken.
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = re.match(r'\s*(\d[\d.,]*)', str(value or ''))
+    return int(re.sub(r'\D', '', digits.group(1))) if digits else 0
+
+
+def load_nested(value):
+    """A nested field as read from products.csv (a JSON string) or a JSON export, None when empty.
+
+    Cells written by json.dumps load as they are, \\u escapes and quotes in
+    option codes included. Older crawlers wrote Python reprs instead, those
+    are read as Python literals. Raises ValueError when neither works.
+    """
+    if not isinstance(value, str):
+        return value
+    if not value.strip():
+        return None
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError, MemoryError, RecursionError) as err:
+        raise ValueError(f"unreadable nested field {value!r:.80}") from err
+
+
+def typed_record(product, product_url=None):
+    """A product record with native types, in the products.csv field order.
+
+    IDs and prices are integers (variation prices included) and variations
+    a list even for simple products, so the JSON outputs load without the
+    conversions convert_csv_to_json.py does for products.csv. `product_url`
+    is added last, as CatalogStore.record does, so refresh.py can find the
+    page of each record again.
+    """
+    record = {field: product[field] for field in PRODUCT_FIELDNAMES if field in product}
+    record.update(product)
+    for field in ('product_id', 'price', 'special_price'):
+        if field in record:
+            record[field] = int(record[field] or 0)
+    record['variations'] = [
+        {**attribute, 'options': [{**option, 'attribute_option_price': int(option['attribute_option_price'] or 0)} for option in attribute['options']]}
+        for attribute in record.get('variations') or []
+    ]
+    if record.get('variation_matrix'):
+        record['variation_matrix'] = {
+            **record['variation_matrix'],
+            'combinations': [
+                {**combination, 'price': int(combination['price'] or 0), 'special_price': int(combination['special_price'] or 0)}
+                for combination in record['variation_matrix']['combinations']
+            ],
+        }
+    if product_url:
+        record['product_url'] = product_url
+    return record
+
+
+def json_array_item(record, first):
+    """A record as an item of a JSON array, the same text json.dump(records, indent=2) gives it."""
+    lines = json.dumps(record, ensure_ascii=False, indent=2).split('\n')
+    return ('\n' if first else ',\n') + '\n'.join('  ' + line for line in lines)
+
+
+def csv_row(product):
+    """A product record as a products.csv row, with the nested fields as JSON strings."""
+    row = dict(product)
+    # Convert variations to JSON string for CSV export
+    if isinstance(row.get('variations'), list):
+        row['variations'] = json.dumps(row['variations'])
+    if isinstance(row.get('variation_matrix'), dict):
+        row['variation_matrix'] = json.dumps(row['variation_matrix'])
+    # Ensure price and special_price are integers
+    row['price'] = int(row['price'])
+    row['special_price'] = int(row['special_price'])
+    return row
+
+
+class RecordSink:
+    """Writes product records to a file as they finish, instead of all at the end of the run.
+
+    Records go to `<path>.part`, which is flushed every `flush_every` records
+    or `flush_interval` seconds so it can be tailed while the crawl runs.
+    close() moves it to `path` atomically; after a crash the .part file
+    keeps everything written so far. A product ID is only written once.
+
+    With a `resume_size`, the .part file of an interrupted run is cut back
+    to that size and appended to, `product_ids` being what it already holds.
+    """
+
+    def __init__(self, path, flush_every=50, flush_interval=5.0, resume_size=None, product_ids=()):
+        self.path = path
+        self.temp_path = f"{path}.part"
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.product_ids = set(product_ids)
+        self.written = len(self.product_ids)
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+        resumed = resume_size is not None
+        if resumed:
+            os.truncate(self.temp_path, resume_size)
+        self.file = open(self.temp_path, 'a' if resumed else 'w', newline='', encoding='utf-8')
+        self.start(resumed)
+
+    def start(self, resumed):
+        pass
+
+    def write_record(self, product, product_url):
+        raise NotImplementedError
+
+    def write(self, product, product_url=None):
+        """Append a product record, returns False if its product ID was already written.
+
+        `product_url` is the page the record was read from, the JSON outputs
+        keep it, products.csv keeps its legacy columns.
+        """
+        if product['product_id'] in self.product_ids:
+            return False
+        self.product_ids.add(product['product_id'])
+        self.write_record(product, product_url)
+        self.written += 1
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+        return True
+
+    def flush(self):
+        self.file.flush()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def close(self, finalize=True):
+        """Close the file and move it into place, or leave the .part file when not `finalize`."""
+        if self.file.closed:
+            return
+        self.flush()
+        if finalize:
+            os.fsync(self.file.fileno())
+        self.file.close()
+        if finalize:
+            os.replace(self.temp_path, self.path)
+
+
+class CsvSink(RecordSink):
+    """products.csv, one row per product."""
+
+    def __init__(self, path='products.csv', fieldnames=PRODUCT_FIELDNAMES, **options):
+        self.fieldnames = fieldnames
+        super().__init__(path, **options)
+
+    def start(self, resumed):
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames)
+        if not resumed:
+            self.writer.writeheader()
+
+    def write_record(self, product, product_url):
+        self.writer.writerow(csv_row(product))
+
+
+class JsonlSink(RecordSink):
+    """One typed JSON object per line, with the nested fields kept as JSON."""
+
+    def write_record(self, product, product_url):
+        self.file.write(json.dumps(typed_record(product, product_url), ensure_ascii=False) + '\n')
+
+
+class JsonSink(RecordSink):
+    """products.json, a JSON array of typed records in the layout convert_csv_to_json.py writes.
+
+    The closing bracket is only written by close(), a .part file left by a
+    crash is resumed by appending to the array.
+    """
+
+    def __init__(self, path='products.json', **options):
+        super().__init__(path, **options)
+
+    def start(self, resumed):
+        if not resumed:
+            self.file.write('[')
+
+    def write_record(self, product, product_url):
+        self.file.write(json_array_item(typed_record(product, product_url), first=not self.written))
+
+    def close(self, finalize=True):
+        if finalize and not self.file.closed:
+            self.file.write('\n]' if self.written else ']')
+        super().close(finalize)
+
+
+SINKS = {
+    '.csv': CsvSink,
+    '.jsonl': JsonlSink,
+    '.json': JsonSink,
+}
+
+
+def open_sink(path, **options):
+    """The sink for an output path, picked by its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS:
+        raise ValueError(f"Unsupported output {path!r}, expected one of {', '.join(SINKS)}")
+    return SINKS[extension](path, **options)
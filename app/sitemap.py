@@ -0,0 +1,102 @@
+import asyncio
+import zlib
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+import aiohttp
+
+from scheduler import request_slot
+
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+IMAGE_NS = '{http://www.google.com/schemas/sitemap-image/1.1}'
+
+# Sitemaps are read in chunks of this size and parsed as they arrive
+SITEMAP_CHUNK_SIZE = 16 * 1024
+
+
+def parse_lastmod(value):
+    """Parse a sitemap <lastmod> into an aware datetime, or None."""
+    if not value:
+        return None
+    try:
+        lastmod = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return lastmod if lastmod.tzinfo else lastmod.replace(tzinfo=timezone.utc)
+
+
+async def read_sitemap(url, session, scheduler=None, retry=None, **fetch_options):
+    """Stream one sitemap through an incremental XML parser.
+
+    Returns the child sitemaps of a sitemap index and the <url> entries of a
+    urlset, as lists of dicts with 'loc', 'lastmod' and (for URLs) 'image_url'.
+    """
+    async def read_once():
+        parser = ET.XMLPullParser(events=('end',))
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if url.endswith('.gz') else None
+        child_sitemaps = []
+        url_entries = []
+
+        def drain_events():
+            for _, element in parser.read_events():
+                if element.tag not in (SITEMAP_NS + 'sitemap', SITEMAP_NS + 'url'):
+                    continue
+
+                entry = {
+                    'loc': (element.findtext(SITEMAP_NS + 'loc') or '').strip(),
+                    'lastmod': element.findtext(SITEMAP_NS + 'lastmod'),
+                }
+                if element.tag == SITEMAP_NS + 'sitemap':
+                    child_sitemaps.append(entry)
+                else:
+                    image_url = element.findtext(f'{IMAGE_NS}image/{IMAGE_NS}loc')
+                    if image_url:
+                        entry['image_url'] = image_url.strip()
+                    url_entries.append(entry)
+                # Finished entries are dropped so memory stays flat on big sitemaps
+                element.clear()
+
+        async with request_slot(scheduler, 'html'):
+            async with session.get(url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(SITEMAP_CHUNK_SIZE):
+                    parser.feed(decompressor.decompress(chunk) if decompressor else chunk)
+                    drain_events()
+        parser.close()
+        drain_events()
+        return child_sitemaps, url_entries
+
+    try:
+        return await (retry.run(url, read_once) if retry else read_once())
+    except (aiohttp.ClientError, asyncio.TimeoutError, ET.ParseError, zlib.error) as err:
+        print(f"Error reading sitemap {url}: {err or type(err).__name__}")
+        return [], []
+
+
+async def iter_sitemap_products(sitemap_url, session, skip_urls=(), **fetch_options):
+    """Yield batches of product entries from a sitemap index and its product sitemaps.
+
+    Every entry gets a sequential product ID in sitemap order, plus its
+    'product_url', 'lastmod' and 'image_url' when the sitemap lists one.
+    URLs in `skip_urls` (such as the /shop/ archive that Yoast lists first)
+    are left out.
+    """
+    product_id = 1
+    pending_sitemaps = [sitemap_url]
+    while pending_sitemaps:
+        child_sitemaps, url_entries = await read_sitemap(pending_sitemaps.pop(0), session, **fetch_options)
+
+        # Only follow the product sitemaps of an index (product-sitemap.xml, wp-sitemap-posts-product-1.xml)
+        pending_sitemaps.extend(child['loc'] for child in child_sitemaps if 'product' in child['loc'])
+
+        products = []
+        for entry in url_entries:
+            if entry['loc'] in skip_urls:
+                continue
+            product = {'product_id': product_id, 'product_url': entry['loc'], 'lastmod': entry['lastmod']}
+            if 'image_url' in entry:
+                product['image_url'] = entry['image_url']
+            products.append(product)
+            product_id += 1
+        if products:
+            yield products
@@ -0,0 +1,123 @@
+import asyncio
+import html
+import json
+import time
+from urllib.parse import urljoin
+
+import aiohttp
+
+from scheduler import request_slot
+
+STORE_API_PATH = '/wp-json/wc/store/v1/products'
+STORE_API_PAGE_SIZE = 100
+
+
+async def fetch_json(url, session, scheduler=None, retry=None, **fetch_options):
+    """Fetch a JSON document, returns (data, headers) or (None, {}) on failure."""
+    async def fetch_once():
+        async with request_slot(scheduler, 'html'):
+            request_start = time.time()
+            async with session.get(url) as response:
+                if scheduler:
+                    scheduler.record_response(response.status, time.time() - request_start)
+                response.raise_for_status()
+                return await response.json(content_type=None), response.headers
+
+    try:
+        return await (retry.run(url, fetch_once) if retry else fetch_once())
+    except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as err:
+        print(f"Error fetching {url}: {err or type(err).__name__}")
+        return None, {}
+
+
+def parse_minor_units(value, minor_unit):
+    """Convert a Store API price string in minor units ('150000') to an integer price."""
+    if value in (None, ''):
+        return 0
+    return int(value) // (10 ** minor_unit)
+
+
+def map_store_product(item, product_id):
+    """Map one Store API product onto the record shape used by products.csv.
+
+    The Store API has no per-variation prices, so configurable products come
+    back with an empty `variations` list for the caller to fill from the HTML.
+    The record has no `product_sku` either, the caller generates it from the name.
+    """
+    prices = item.get('prices') or {}
+    minor_unit = prices.get('currency_minor_unit', 0)
+    regular_price = parse_minor_units(prices.get('regular_price'), minor_unit)
+    sale_price = parse_minor_units(prices.get('sale_price'), minor_unit)
+    price_range = prices.get('price_range')
+
+    product_details = {'product_id': product_id, 'product_name': html.unescape(item.get('name', '')).strip()}
+
+    # Same rules as the price block on the product page
+    if price_range:
+        product_details['price'] = parse_minor_units(price_range.get('min_amount'), minor_unit)
+        product_details['special_price'] = 0
+    elif item.get('on_sale') and 0 < sale_price < regular_price:
+        product_details['price'] = regular_price
+        product_details['special_price'] = sale_price
+    else:
+        product_details['price'] = regular_price or parse_minor_units(prices.get('price'), minor_unit)
+        product_details['special_price'] = 0
+
+    short_description = (item.get('short_description') or '').strip()
+    if short_description:
+        product_details['short_description'] = f'<div class="product-short-description">\n{short_description}\n</div>'
+
+    categories = [html.unescape(category['name']) for category in item.get('categories', [])]
+    if categories:
+        product_details['category'] = ', '.join(categories)
+
+    description = (item.get('description') or '').strip()
+    if description:
+        product_details['description'] = description
+
+    if item.get('type') == 'variable':
+        product_details['product_type'] = 'configurable'
+        product_details['variations'] = []
+    else:
+        product_details['product_type'] = 'simple'
+        product_details['variations'] = None
+
+    return product_details
+
+
+async def iter_store_api_products(base_url, session, page_size=STORE_API_PAGE_SIZE, **fetch_options):
+    """Yield pages of products from /wp-json/wc/store/v1/products.
+
+    Each entry carries 'product_id', 'product_url', 'image_url' and the mapped
+    record under 'store_record'. Pages after the first are fetched
+    concurrently and yielded in order, so product IDs are deterministic.
+    """
+    api_url = urljoin(base_url, STORE_API_PATH)
+
+    def page_url(page_number):
+        return f"{api_url}?per_page={page_size}&page={page_number}&orderby=menu_order&order=asc"
+
+    first_page, headers = await fetch_json(page_url(1), session, **fetch_options)
+    if not isinstance(first_page, list):
+        return
+
+    total_pages = int(headers.get('X-WP-TotalPages') or 1)
+    pending = {n: asyncio.create_task(fetch_json(page_url(n), session, **fetch_options)) for n in range(2, total_pages + 1)}
+
+    product_id = 1
+    try:
+        for page_number in range(1, total_pages + 1):
+            items = first_page if page_number == 1 else (await pending.pop(page_number))[0]
+
+            products = []
+            for item in items or []:
+                product = {'product_id': product_id, 'product_url': item.get('permalink', '')}
+                if item.get('images'):
+                    product['image_url'] = item['images'][0]['src']
+                product['store_record'] = map_store_product(item, product_id)
+                products.append(product)
+                product_id += 1
+            yield products
+    finally:
+        for task in pending.values():
+            task.cancel()
@@ -0,0 +1,219 @@
+import asyncio
+import copy
+import re
+from collections import Counter
+from typing import NamedTuple, Optional
+
+from parsers import LISTING_REGIONS, PRODUCT_REGIONS, ParsePool, extract, get_backend, run_extractor
+
+# Extractors whose first argument is the page HTML and that can work on a slice of it
+SLICED_METHODS = ('parse_product', 'parse_product_jsonld', 'parse_listing')
+
+HEAD_END = '</head>'
+
+START_TAG = re.compile(r'<[a-zA-Z][^<>]*>')
+
+
+def region_pattern(regions, *extra_patterns):
+    """Regex matching the start tags that open one of `regions` ((tag, class) pairs)."""
+    alternatives = [
+        rf'<{tag}\b[^>]*?\bclass\s*=\s*["\'][^"\']*?(?<![\w-]){re.escape(class_name)}(?![\w-])'
+        for tag, class_name in regions
+    ]
+    return re.compile('|'.join(alternatives + list(extra_patterns)), re.IGNORECASE)
+
+
+PRODUCT_REGION_TAGS = region_pattern(PRODUCT_REGIONS, r'<meta\b[^>]*?property\s*=\s*["\']og:image["\']', r'<script\b[^>]*?application/ld\+json')
+
+# Start tags of what each extractor reads. A slice has to keep every one the
+# page has, whether or not the pages the template was learned from had it.
+SLICED_REGIONS = {
+    'parse_product': PRODUCT_REGION_TAGS,
+    'parse_product_jsonld': PRODUCT_REGION_TAGS,
+    'parse_listing': region_pattern(LISTING_REGIONS),
+}
+
+
+def slice_page(template, method, html):
+    """The slice of `html` to parse, or None when a marker or one of the page's regions falls outside of it."""
+    sliced = template.slice(html)
+    if sliced is None:
+        return None
+    regions = SLICED_REGIONS[method]
+    if len(regions.findall(sliced)) != len(regions.findall(html)):
+        return None
+    return sliced
+
+
+class PageTemplate(NamedTuple):
+    """Where the part of a page that the extractors need starts and ends.
+
+    The slice runs from `start_marker` (or the start of the page) up to
+    `end_marker` (or the end of the page). With `keep_head`, the <head> is
+    kept in front of it for the fields read from there, like og:image.
+    """
+
+    keep_head: bool
+    start_marker: Optional[str]
+    end_marker: Optional[str]
+
+    def slice(self, html):
+        """The part of `html` to parse, or None when a marker is missing from the page."""
+        pieces = []
+        content_start = 0
+        if self.keep_head:
+            head_end = html.find(HEAD_END)
+            if head_end < 0:
+                return None
+            content_start = head_end + len(HEAD_END)
+            pieces.append(html[:content_start])
+
+        start = content_start
+        if self.start_marker:
+            start = html.find(self.start_marker, content_start)
+            if start < 0:
+                return None
+
+        end = len(html)
+        if self.end_marker:
+            end = html.find(self.end_marker, start)
+            if end < 0:
+                return None
+
+        pieces.append(html[start:end])
+        return ''.join(pieces)
+
+
+def stable_markers(pages):
+    """Start tags found exactly once on every page, in the same order, ordered by position."""
+    counts = [Counter(START_TAG.findall(page)) for page in pages]
+    unique_tags = [tag for tag, count in counts[0].items() if count == 1 and all(other.get(tag) == 1 for other in counts[1:])]
+    unique_tags.sort(key=pages[0].find)
+
+    markers = []
+    last_positions = [-1] * len(pages)
+    for tag in unique_tags:
+        positions = [page.find(tag) for page in pages]
+        if all(position > last for position, last in zip(positions, last_positions)):
+            markers.append(tag)
+            last_positions = positions
+    return markers
+
+
+def first_match(count, predicate):
+    """Lowest index in range(count) where `predicate` holds, for a predicate that stays true once it is."""
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if predicate(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return low if low < count else None
+
+
+def last_match(count, predicate):
+    """Highest index in range(count) where `predicate` holds, for a predicate that stays false once it is."""
+    low, high = -1, count - 1
+    while low < high:
+        middle = (low + high + 1) // 2
+        if predicate(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low if low >= 0 else None
+
+
+def learn_template(parser, method, samples):
+    """Learn the PageTemplate of a kind of page from (args, record) samples parsed in full.
+
+    A template is only kept if every sample extracts exactly the same
+    record from its slice as from the whole page. Returns None when no
+    marker can be cut at.
+    """
+    pages = [args[0] for args, _ in samples]
+
+    def matches(template):
+        for args, expected in samples:
+            sliced = slice_page(template, method, args[0])
+            if sliced is None or run_extractor(parser, method, sliced, *args[1:]) != expected:
+                return False
+        return True
+
+    markers = stable_markers(pages)
+
+    # Earliest marker the page can end at, dropping the footer and whatever follows it
+    end_index = first_match(len(markers), lambda i: matches(PageTemplate(False, None, markers[i])))
+    end_marker = markers[end_index] if end_index is not None else None
+
+    # Latest marker the content can start at after the <head>, dropping the header and menus
+    head_end = pages[0].find(HEAD_END)
+    start_candidates = [marker for marker in markers[:end_index] if pages[0].find(marker) > head_end >= 0]
+    start_index = last_match(len(start_candidates), lambda i: matches(PageTemplate(True, start_candidates[i], end_marker)))
+    start_marker = start_candidates[start_index] if start_index is not None else None
+
+    if not start_marker and not end_marker:
+        return None
+    keep_head = bool(start_marker) and not matches(PageTemplate(False, start_marker, end_marker))
+    return PageTemplate(keep_head, start_marker, end_marker)
+
+
+class TemplateSlicer:
+    """Parses only the part of each page that isn't shared site template.
+
+    Wraps a backend name or a ParsePool. The first `sample_size` pages of
+    each kind are parsed in full and a PageTemplate is learned from them;
+    after that only each page's slice is handed to the parser. Pages
+    missing a marker, or with a region of SLICED_REGIONS outside of the
+    slice (e.g. a description tab none of the samples had), fall back to a
+    full parse and are counted.
+    """
+
+    def __init__(self, parser='bs4', sample_size=3):
+        self.parser = parser
+        self.backend = parser.parser if isinstance(parser, ParsePool) else parser
+        self.sample_size = sample_size
+        self.samples = {method: [] for method in SLICED_METHODS}
+        self.templates = {}
+        self.sliced = 0
+        self.fallbacks = 0
+        self.chars_total = 0
+        self.chars_parsed = 0
+
+    async def run(self, method, *args):
+        if method not in self.samples:
+            return await extract(self.parser, method, *args)
+
+        html = args[0]
+        template = self.templates.get(method)
+        if template:
+            sliced = slice_page(template, method, html)
+            if sliced is not None:
+                self.sliced += 1
+                self.chars_total += len(html)
+                self.chars_parsed += len(sliced)
+                return await extract(self.parser, method, sliced, *args[1:])
+            self.fallbacks += 1
+
+        result = await extract(self.parser, method, *args)
+        samples = self.samples[method]
+        if method not in self.templates:
+            # The caller goes on to modify the record, keep it as extracted
+            samples.append((args, copy.deepcopy(result)))
+            if len(samples) == self.sample_size:
+                # Pages arriving while the template is learned are parsed in full
+                self.templates[method] = None
+                self.templates[method] = await asyncio.to_thread(learn_template, self.backend, method, samples)
+                samples.clear()
+        return result
+
+    def describe(self):
+        parser = self.parser.describe() if isinstance(self.parser, ParsePool) else f"{get_backend(self.parser).name} backend"
+        return f"{parser}, parsing only the content slice of each page once {self.sample_size} samples are seen"
+
+    def report(self):
+        for method in SLICED_METHODS:
+            if method in self.templates and not self.templates[method]:
+                print(f"Template slicing: no stable content markers found for {method}, those pages were parsed in full")
+        share = self.chars_parsed / self.chars_total if self.chars_total else 0
+        print(f"Template slicing: {self.sliced} pages sliced to {share:.0%} of their HTML, {self.fallbacks} fell back to a full parse")
@@ -1,5 +1,6 @@
 import requests
-from bs4 import BeautifulSoup
+from parsers import get_backend
+from extraction import LEGACY_LISTING_TILE_FIELDS, LEGACY_PRODUCT_FIELDS
 import csv
 import json
 import concurrent.futures
@@ -25,58 +26,7 @@ def scrape_product_details(product_url):
     if not html:
         return {}
 
-    soup = BeautifulSoup(html, 'html.parser')
-    product_details = {}
-
-    # Get the product name
-    product_name_tag = soup.find('h1', class_='product-title')
-    if product_name_tag:
-        product_details['product_name'] = product_name_tag.text.strip()
-
-    # Get the price (for simple products)
-    price_tag = soup.find('p', class_='price')
-    if price_tag:
-        product_details['price'] = price_tag.text.strip().replace('₫', '').replace('&nbsp;', '')
-
-    # Get the product short description
-    short_description_tag = soup.find('div', class_='product-short-description')
-    if short_description_tag:
-        product_details['short_description'] = short_description_tag.text.strip()
-
-    # Get product categories
-    category_tags = soup.find('span', class_='posted_in')
-    categories = []
-    if category_tags:
-        for category_tag in category_tags.find_all('a', rel='tag'):
-            categories.append(category_tag.text.strip())
-        product_details['category'] = ', '.join(categories)
-
-    # Check if product is configurable and gather variations
-    variation_form = soup.find('form', class_='variations_form cart')
-    if variation_form:
-        product_details['product_type'] = 'configurable'
-        product_details['variations'] = []
-
-        # Get variation data by parsing the JSON data in the form
-        variations_data = variation_form.get('data-product_variations')
-        if variations_data:
-            try:
-                variations = json.loads(variations_data)
-                for variation in variations:
-                    if 'display_price' in variation and 'attributes' in variation:
-                        variation_code = variation['attributes'].get('attribute_pa_ma-san-pham', '')
-                        variation_price = variation['display_price']
-                        product_details['variations'].append({
-                            'variation_code': variation_code,
-                            'variation_price': f"{variation_price}₫"
-                        })
-            except json.JSONDecodeError as e:
-                print(f"Error parsing variations data for {product_url}: {e}")
-    else:
-        product_details['product_type'] = 'simple'
-        product_details['variations'] = None  # Set variations to null for simple products
-
-    return product_details
+    return get_backend().parse_fields(html, LEGACY_PRODUCT_FIELDS, product_url)
 
 
 def scrape_page(url):
@@ -85,36 +35,7 @@ def scrape_page(url):
     if not html:
         return [], None
 
-    soup = BeautifulSoup(html, 'html.parser')
-
-    # Find the main product list container
-    products_container = soup.find('div', class_='products')
-    if not products_container:
-        return [], None  # No products found, return empty list
-
-    products = []
-
-    # Iterate over each product block
-    for product_item in products_container.find_all('div', class_='product-small', recursive=False):
-        product_data = {}
-        
-        # Get product name and URL
-        product_name_tag = product_item.find('p', class_='name product-title woocommerce-loop-product__title')
-        if product_name_tag and product_name_tag.find('a'):
-            product_url = product_name_tag.find('a')['href']
-            product_data['product_url'] = product_url  # Store product URL for later fetching
-
-            # Get the image URL
-            product_image_tag = product_item.find('img')
-            if product_image_tag:
-                product_data['image_url'] = product_image_tag['src']
-
-            products.append(product_data)
-
-    # Check for pagination and next page
-    next_page_link = soup.find('a', class_='next page-number')
-    next_page_url = next_page_link['href'] if next_page_link else None
-
+    products, next_page_url, _, _ = get_backend().parse_listing(html, None, LEGACY_LISTING_TILE_FIELDS)
     return products, next_page_url
 
 
@@ -1,15 +1,15 @@
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
 import csv
 import json
 import time
 from tqdm import tqdm
 import os
-import re
-import unicodedata
 from urllib.parse import urlparse
 import aiofiles
+from scheduler import CrawlScheduler, request_slot
+from parsers import get_backend
+from extraction import LEGACY_LISTING_TILE_FIELDS, LEGACY_PRODUCT_FIELDS, PRODUCT_TITLE, Field, replace_fields, sku_from_title
 
 
 # Function to determine max workers
@@ -18,156 +18,69 @@ def get_max_workers():
     return min(2 * cpu_count, 10000)
 
 
-async def fetch_url(url, session):
+async def fetch_url(url, session, scheduler=None):
     """Fetch a URL using aiohttp asynchronously."""
     try:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            return await response.text()
+        async with request_slot(scheduler, 'html'):
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return await response.text()
     except aiohttp.ClientError as err:
         print(f"Error fetching {url}: {err}")
         return None
 
 
-async def download_image(url, folder, session):
+async def download_image(url, folder, session, scheduler=None):
     """Download image and save to folder."""
     try:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            image_data = await response.read()
+        async with request_slot(scheduler, 'image'):
+            async with session.get(url) as response:
+                response.raise_for_status()
+                image_data = await response.read()
 
-            # Parse the image filename from the URL
-            parsed_url = urlparse(url)
-            image_name = os.path.basename(parsed_url.path)
+                # Parse the image filename from the URL
+                parsed_url = urlparse(url)
+                image_name = os.path.basename(parsed_url.path)
 
-            # Ensure the folder exists
-            os.makedirs(folder, exist_ok=True)
+                # Ensure the folder exists
+                os.makedirs(folder, exist_ok=True)
 
-            # Save the image to the folder
-            image_path = os.path.join(folder, image_name)
-            async with aiofiles.open(image_path, 'wb') as img_file:
-                await img_file.write(image_data)
+                # Save the image to the folder
+                image_path = os.path.join(folder, image_name)
+                async with aiofiles.open(image_path, 'wb') as img_file:
+                    await img_file.write(image_data)
 
-            return image_path
+                return image_path
     except aiohttp.ClientError as err:
         print(f"Error downloading image {url}: {err}")
         return None
 
 
-def remove_accents(input_str):
-    """Remove accents from the input string."""
-    nfkd_form = unicodedata.normalize('NFD', input_str)
-    return re.sub(r'[\u0300-\u036f]', '', nfkd_form).replace('đ', 'd').replace('Đ', 'D')
+# v3 fields plus a SKU, with the short description kept as HTML for CKEditor
+PRODUCT_SPEC = replace_fields(
+    LEGACY_PRODUCT_FIELDS,
+    Field('product_sku', PRODUCT_TITLE, post=sku_from_title),
+    Field('short_description', 'div.product-short-description', read='outer_html'),
+)
 
 
-def generate_product_sku(product_name):
-    """Generate product SKU from product name."""
-    product_sku = re.sub(r'[^\w\s]', '', product_name).lower().replace(' ', '_')
-    return remove_accents(product_sku)
-
-
-async def scrape_product_details(product_url, product_id, session):
+async def scrape_product_details(product_url, product_id, session, scheduler=None):
     """Fetch product details from the product detail page asynchronously."""
-    html = await fetch_url(product_url, session)
+    html = await fetch_url(product_url, session, scheduler)
     if not html:
         return {}
 
-    soup = BeautifulSoup(html, 'html.parser')
-    product_details = {'product_id': product_id}
-
-    # Get the product name
-    product_name_tag = soup.find('h1', class_='product-title')
-    if product_name_tag:
-        product_details['product_name'] = product_name_tag.text.strip()
-
-        # Generate product SKU based on product name
-        product_details['product_sku'] = generate_product_sku(product_details['product_name'])
-
-    # Get the price (for simple products)
-    price_tag = soup.find('p', class_='price')
-    if price_tag:
-        product_details['price'] = price_tag.text.strip().replace('₫', '').replace('&nbsp;', '')
-
-    # Get the product short description (including HTML formatting for CKEditor)
-    short_description_tag = soup.find('div', class_='product-short-description')
-    if short_description_tag:
-        product_details['short_description'] = str(short_description_tag)  # Save HTML as a string
-
-    # Get product categories
-    category_tags = soup.find('span', class_='posted_in')
-    categories = []
-    if category_tags:
-        for category_tag in category_tags.find_all('a', rel='tag'):
-            categories.append(category_tag.text.strip())
-        product_details['category'] = ', '.join(categories)
-
-    # Check if product is configurable and gather variations
-    variation_form = soup.find('form', class_='variations_form cart')
-    if variation_form:
-        product_details['product_type'] = 'configurable'
-        product_details['variations'] = []
-
-        # Get variation data by parsing the JSON data in the form
-        variations_data = variation_form.get('data-product_variations')
-        if variations_data:
-            try:
-                variations = json.loads(variations_data)
-                for variation in variations:
-                    if 'display_price' in variation and 'attributes' in variation:
-                        variation_code = variation['attributes'].get('attribute_pa_ma-san-pham', '')
-                        variation_price = variation['display_price']
-                        product_details['variations'].append({
-                            'variation_code': variation_code,
-                            'variation_price': f"{variation_price}₫"
-                        })
-            except json.JSONDecodeError as e:
-                print(f"Error parsing variations data for {product_url}: {e}")
-    else:
-        product_details['product_type'] = 'simple'
-        product_details['variations'] = None  # Set variations to null for simple products
-
-    return product_details
-
-
-async def scrape_page(url, start_product_id, session):
+    return get_backend().parse_product(html, product_id, product_url, PRODUCT_SPEC)
+
+
+async def scrape_page(url, start_product_id, session, scheduler=None):
     """Fetch and parse a single page of products asynchronously."""
-    html = await fetch_url(url, session)
+    html = await fetch_url(url, session, scheduler)
     if not html:
         return [], None, start_product_id  # Return empty list, no next page, and unchanged product_id
 
-    soup = BeautifulSoup(html, 'html.parser')
-
-    # Find the main product list container
-    products_container = soup.find('div', class_='products')
-    if not products_container:
-        return [], None, start_product_id  # No products found, return empty list, no next page, and unchanged product_id
-
-    products = []
-    product_id = start_product_id  # Initialize product ID for this page
-
-    # Iterate over each product block
-    for product_item in products_container.find_all('div', class_='product-small', recursive=False):
-        product_data = {'product_id': product_id}  # Assign product ID
-        
-        # Get product name and URL
-        product_name_tag = product_item.find('p', class_='name product-title woocommerce-loop-product__title')
-        if product_name_tag and product_name_tag.find('a'):
-            product_url = product_name_tag.find('a')['href']
-            product_data['product_url'] = product_url  # Store product URL for later fetching
-
-            # Get the image URL
-            product_image_tag = product_item.find('img')
-            if product_image_tag:
-                product_data['image_url'] = product_image_tag['src']
-
-            products.append(product_data)
-            product_id += 1  # Increment product ID
-
-    # Check for pagination and next page
-    next_page_link = soup.find('a', class_='next page-number')
-    next_page_url = next_page_link['href'] if next_page_link else None
-
-    return products, next_page_url, product_id  # Return the updated product_id
+    page_products, next_page_url, product_id, _ = get_backend().parse_listing(html, start_product_id, LEGACY_LISTING_TILE_FIELDS)
+    return page_products, next_page_url, product_id  # Return the updated product_id
 
 
 async def crawl_wordpress_products(base_url, max_workers=None):
@@ -182,14 +95,15 @@ async def crawl_wordpress_products(base_url, max_workers=None):
     if max_workers is None:
         max_workers = get_max_workers()
 
-    print(f"Using {max_workers} workers...")
+    scheduler = CrawlScheduler(max_workers)
+    print(f"Using {scheduler.describe()}...")
 
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(connector=scheduler.make_connector()) as session:
         print("Starting to scrape pages...")
         while current_url:
             print(f"Scraping page: {current_url}")
             try:
-                page_products, next_page_url, start_product_id = await scrape_page(current_url, start_product_id, session)
+                page_products, next_page_url, start_product_id = await scrape_page(current_url, start_product_id, session, scheduler)
                 
                 for product in page_products:
                     all_product_data.append(product)
@@ -201,7 +115,7 @@ async def crawl_wordpress_products(base_url, max_workers=None):
 
         print(f"Fetching details for {len(all_product_data)} products concurrently...")
         detailed_products = []
-        tasks = [scrape_product_details(p['product_url'], p['product_id'], session) for p in all_product_data]
+        tasks = [scrape_product_details(p['product_url'], p['product_id'], session, scheduler) for p in all_product_data]
         
         for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Fetching Product Details"):
             detailed_product = await task
@@ -218,7 +132,7 @@ async def crawl_wordpress_products(base_url, max_workers=None):
             if 'image_url' in product and product['product_id'] in id_to_sku:
                 product_sku = id_to_sku[product['product_id']]
                 image_url = product['image_url']
-                image_tasks.append(download_image(image_url, f"./images/{product_sku}", session))
+                image_tasks.append(download_image(image_url, f"./images/{product_sku}", session, scheduler))
         
         downloaded_images = []
         for task in tqdm(asyncio.as_completed(image_tasks), total=len(image_tasks), desc="Downloading Images"):
@@ -1,6 +1,9 @@
 import aiohttp
 import asyncio
 from bs4 import BeautifulSoup
+from scheduler import CrawlScheduler, request_slot
+from parsers import get_backend
+from extraction import LEGACY_LISTING_TILE_FIELDS, LEGACY_PRODUCT_FIELDS
 import csv
 import json
 import time
@@ -15,21 +18,22 @@ def get_max_workers():
 
 
 # Asynchronous function to fetch URLs
-async def fetch_url(url, session):
+async def fetch_url(url, session, scheduler=None):
     """Fetch a URL asynchronously."""
     try:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            return await response.text()
+        async with request_slot(scheduler, 'html'):
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return await response.text()
     except aiohttp.ClientError as err:
         print(f"Error fetching {url}: {err}")
         return None
 
 
 # Asynchronous category scraper
-async def scrape_categories(session, base_url):
+async def scrape_categories(session, base_url, scheduler=None):
     """Scrape WordPress categories asynchronously."""
-    html = await fetch_url(base_url, session)
+    html = await fetch_url(base_url, session, scheduler)
     if not html:
         return []
 
@@ -79,94 +83,24 @@ def save_categories_to_csv(categories):
 
 
 # Asynchronous product details scraper
-async def scrape_product_details(product_url, product_id, session):
+async def scrape_product_details(product_url, product_id, session, scheduler=None):
     """Fetch product details asynchronously."""
-    html = await fetch_url(product_url, session)
+    html = await fetch_url(product_url, session, scheduler)
     if not html:
         return {}
 
-    soup = BeautifulSoup(html, 'html.parser')
-    product_details = {'product_id': product_id}
-
-    product_name_tag = soup.find('h1', class_='product-title')
-    if product_name_tag:
-        product_details['product_name'] = product_name_tag.text.strip()
-
-    price_tag = soup.find('p', class_='price')
-    if price_tag:
-        product_details['price'] = price_tag.text.strip().replace('₫', '').replace('&nbsp;', '')
-
-    short_description_tag = soup.find('div', class_='product-short-description')
-    if short_description_tag:
-        product_details['short_description'] = short_description_tag.text.strip()
-
-    category_tags = soup.find('span', class_='posted_in')
-    categories = []
-    if category_tags:
-        for category_tag in category_tags.find_all('a', rel='tag'):
-            categories.append(category_tag.text.strip())
-        product_details['category'] = ', '.join(categories)
-
-    variation_form = soup.find('form', class_='variations_form cart')
-    if variation_form:
-        product_details['product_type'] = 'configurable'
-        product_details['variations'] = []
-
-        variations_data = variation_form.get('data-product_variations')
-        if variations_data:
-            try:
-                variations = json.loads(variations_data)
-                for variation in variations:
-                    if 'display_price' in variation and 'attributes' in variation:
-                        variation_code = variation['attributes'].get('attribute_pa_ma-san-pham', '')
-                        variation_price = variation['display_price']
-                        product_details['variations'].append({
-                            'variation_code': variation_code,
-                            'variation_price': f"{variation_price}₫"
-                        })
-            except json.JSONDecodeError as e:
-                print(f"Error parsing variations data for {product_url}: {e}")
-    else:
-        product_details['product_type'] = 'simple'
-        product_details['variations'] = None
-
-    return product_details
+    return get_backend().parse_product(html, product_id, product_url, LEGACY_PRODUCT_FIELDS)
 
 
 # Asynchronous page scraper for products
-async def scrape_page(url, start_product_id, session):
+async def scrape_page(url, start_product_id, session, scheduler=None):
     """Fetch and parse a page of products asynchronously."""
-    html = await fetch_url(url, session)
+    html = await fetch_url(url, session, scheduler)
     if not html:
         return [], None
 
-    soup = BeautifulSoup(html, 'html.parser')
-    products_container = soup.find('div', class_='products')
-    if not products_container:
-        return [], None
-
-    products = []
-    product_id = start_product_id
-
-    for product_item in products_container.find_all('div', class_='product-small', recursive=False):
-        product_data = {'product_id': product_id}
-
-        product_name_tag = product_item.find('p', class_='name product-title woocommerce-loop-product__title')
-        if product_name_tag and product_name_tag.find('a'):
-            product_url = product_name_tag.find('a')['href']
-            product_data['product_url'] = product_url
-
-            product_image_tag = product_item.find('img')
-            if product_image_tag:
-                product_data['image_url'] = product_image_tag['src']
-
-            products.append(product_data)
-            product_id += 1
-
-    next_page_link = soup.find('a', class_='next page-number')
-    next_page_url = next_page_link['href'] if next_page_link else None
-
-    return products, next_page_url, product_id
+    page_products, next_page_url, product_id, _ = get_backend().parse_listing(html, start_product_id, LEGACY_LISTING_TILE_FIELDS)
+    return page_products, next_page_url, product_id  # Return the updated product_id
 
 
 # Combine everything and crawl products & categories asynchronously
@@ -177,11 +111,12 @@ async def crawl_wordpress(base_url, max_workers=None):
     if max_workers is None:
         max_workers = get_max_workers()
 
-    print(f"Using {max_workers} workers...")
+    scheduler = CrawlScheduler(max_workers)
+    print(f"Using {scheduler.describe()}...")
 
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(connector=scheduler.make_connector()) as session:
         print("Scraping categories...")
-        categories = await scrape_categories(session, base_url)
+        categories = await scrape_categories(session, base_url, scheduler)
         save_categories_to_csv(categories)
 
         print("Scraping products...")
@@ -190,13 +125,13 @@ async def crawl_wordpress(base_url, max_workers=None):
         start_product_id = 1
 
         while current_url:
-            page_products, next_page_url, start_product_id = await scrape_page(current_url, start_product_id, session)
+            page_products, next_page_url, start_product_id = await scrape_page(current_url, start_product_id, session, scheduler)
             all_product_data.extend(page_products)
             current_url = next_page_url
 
         print(f"Fetching details for {len(all_product_data)} products concurrently...")
         detailed_products = []
-        tasks = [scrape_product_details(p['product_url'], p['product_id'], session) for p in all_product_data]
+        tasks = [scrape_product_details(p['product_url'], p['product_id'], session, scheduler) for p in all_product_data]
 
         for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Fetching Product Details"):
             detailed_products.append(await task)
@@ -1,15 +1,14 @@
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
 import csv
 import json
 import time
 from tqdm import tqdm
 import os
-import re
-import unicodedata
 from urllib.parse import urlparse
 import aiofiles
+from parsers import get_backend
+from extraction import LEGACY_LISTING_TILE_FIELDS, LEGACY_PRODUCT_FIELDS, PRODUCT_TITLE, VARIATIONS_FORM, Field, replace_fields, sku_from_title
 
 
 # Function to determine max workers
@@ -54,109 +53,23 @@ async def download_image(url, folder, session):
         return None
 
 
-def remove_accents(input_str):
-    """Remove accents from the input string."""
-    nfkd_form = unicodedata.normalize('NFD', input_str)
-    return re.sub(r'[\u0300-\u036f]', '', nfkd_form).replace('đ', 'd').replace('Đ', 'D')
+# v3 fields plus a SKU, with the short description kept as HTML for CKEditor and variations
+# listed per attribute option
+PRODUCT_SPEC = replace_fields(
+    LEGACY_PRODUCT_FIELDS,
+    Field('product_sku', PRODUCT_TITLE, post=sku_from_title),
+    Field('short_description', 'div.product-short-description', read='outer_html'),
+    Field('variations', VARIATIONS_FORM, read='variations:options', default=None),
+)
 
 
-def generate_product_sku(product_name):
-    """Generate product SKU from product name."""
-    product_sku = re.sub(r'[^\w\s]', '', product_name).lower().replace(' ', '_')
-    return remove_accents(product_sku)
-
 async def scrape_product_details(product_url, product_id, session):
     """Fetch product details from the product detail page asynchronously."""
     html = await fetch_url(product_url, session)
     if not html:
         return {}
 
-    soup = BeautifulSoup(html, 'html.parser')
-    product_details = {'product_id': product_id}
-
-    # Get the product name
-    product_name_tag = soup.find('h1', class_='product-title')
-    if product_name_tag:
-        product_details['product_name'] = product_name_tag.text.strip()
-
-        # Generate product SKU based on product name
-        product_details['product_sku'] = generate_product_sku(product_details['product_name'])
-
-    # Get the price (for simple products)
-    price_tag = soup.find('p', class_='price')
-    if price_tag:
-        product_details['price'] = price_tag.text.strip().replace('₫', '').replace('&nbsp;', '')
-
-    # Get the product short description (including HTML formatting for CKEditor)
-    short_description_tag = soup.find('div', class_='product-short-description')
-    if short_description_tag:
-        product_details['short_description'] = str(short_description_tag)  # Save HTML as a string
-
-    # Get product categories
-    category_tags = soup.find('span', class_='posted_in')
-    categories = []
-    if category_tags:
-        for category_tag in category_tags.find_all('a', rel='tag'):
-            categories.append(category_tag.text.strip())
-        product_details['category'] = ', '.join(categories)
-
-    # Check if product is configurable and gather variations
-    variation_form = soup.find('form', class_='variations_form cart')
-    if variation_form:
-        product_details['product_type'] = 'configurable'
-        product_details['variations'] = []
-
-        # Extract variation details from the JSON data in the form
-        variations_data = variation_form.get('data-product_variations')
-        attribute_price_map = {}
-        if variations_data:
-            try:
-                variations = json.loads(variations_data)
-                for variation in variations:
-                    if 'display_price' in variation and 'attributes' in variation:
-                        price = variation['display_price']
-                        for attribute, value in variation['attributes'].items():
-                            attribute_code = attribute.replace('attribute_pa_', '')
-                            if attribute_code not in attribute_price_map:
-                                attribute_price_map[attribute_code] = {}
-                            attribute_price_map[attribute_code][value] = price
-            except json.JSONDecodeError as e:
-                print(f"Error parsing variations data for {product_url}: {e}")
-
-        # Parse variation attributes from the HTML
-        table_variations = soup.find_all('table', class_='variations')
-        for table in table_variations:
-            for row in table.find_all('tr'):
-                label = row.find('label')
-                select = row.find('select')
-                if label and select:
-                    attribute_name = label.text.strip()
-                    attribute_code = select.get('name', '').replace('attribute_pa_', '')
-
-                    options = []
-                    for option in select.find_all('option'):
-                        option_value = option.get('value', '')
-                        if option_value:
-                            # Get the display text for the option
-                            option_text = option.text.strip()
-                            # Fetch the price from the attribute_price_map if available
-                            option_price = attribute_price_map.get(attribute_code, {}).get(option_value, 0)
-                            options.append({
-                                'attribute_option_code': option_text,
-                                'attribute_option_price': option_price
-                            })
-
-                    if options:
-                        product_details['variations'].append({
-                            'attribute_name': attribute_name,
-                            'attribute_code': attribute_code,
-                            'options': options
-                        })
-    else:
-        product_details['product_type'] = 'simple'
-        product_details['variations'] = None  # Set variations to null for simple products
-
-    return product_details
+    return get_backend().parse_product(html, product_id, product_url, PRODUCT_SPEC)
 
 
 async def scrape_page(url, start_product_id, session):
@@ -165,39 +78,8 @@ async def scrape_page(url, start_product_id, session):
     if not html:
         return [], None, start_product_id  # Return empty list, no next page, and unchanged product_id
 
-    soup = BeautifulSoup(html, 'html.parser')
-
-    # Find the main product list container
-    products_container = soup.find('div', class_='products')
-    if not products_container:
-        return [], None, start_product_id  # No products found, return empty list, no next page, and unchanged product_id
-
-    products = []
-    product_id = start_product_id  # Initialize product ID for this page
-
-    # Iterate over each product block
-    for product_item in products_container.find_all('div', class_='product-small', recursive=False):
-        product_data = {'product_id': product_id}  # Assign product ID
-        
-        # Get product name and URL
-        product_name_tag = product_item.find('p', class_='name product-title woocommerce-loop-product__title')
-        if product_name_tag and product_name_tag.find('a'):
-            product_url = product_name_tag.find('a')['href']
-            product_data['product_url'] = product_url  # Store product URL for later fetching
-
-            # Get the image URL
-            product_image_tag = product_item.find('img')
-            if product_image_tag:
-                product_data['image_url'] = product_image_tag['src']
-
-            products.append(product_data)
-            product_id += 1  # Increment product ID
-
-    # Check for pagination and next page
-    next_page_link = soup.find('a', class_='next page-number')
-    next_page_url = next_page_link['href'] if next_page_link else None
-
-    return products, next_page_url, product_id  # Return the updated product_id
+    page_products, next_page_url, product_id, _ = get_backend().parse_listing(html, start_product_id, LEGACY_LISTING_TILE_FIELDS)
+    return page_products, next_page_url, product_id  # Return the updated product_id
 
 
 async def crawl_wordpress_products(base_url, max_workers=None):
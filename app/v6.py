@@ -1,16 +1,33 @@
+import argparse
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
-import csv
-import json
+import itertools
 import time
 from tqdm import tqdm
 import os
-import re
-import unicodedata
-from urllib.parse import urlparse
+import tempfile
+from urllib.parse import urlparse, urljoin
 import aiofiles
-from image_optimizer import run_optimization
+from image_optimizer import run_optimization, optimize_image_sync
+from scheduler import CrawlScheduler, request_slot
+from http_cache import CacheMiss, HttpCache
+from incremental import IncrementalState
+from retry import RetryPolicy
+from sitemap import iter_sitemap_products
+from store_api import iter_store_api_products
+from parsers import PARSER_BACKENDS, ParsePool, attribute_option_variations, build_variation_matrix, extract, get_backend
+from variation_ajax import VariationCache, resolve_variations
+from sanitize import HtmlSanitizer
+from template_slicing import TemplateSlicer
+from jsonld import JsonLdFastPath
+from sinks import open_sink
+from journal import CrawlJournal
+from catalog import CatalogStore
+from extraction import generate_product_sku
+
+# Images are streamed to disk in chunks of this size
+IMAGE_CHUNK_SIZE = 64 * 1024
+
 
 # Function to determine max workers
 def get_max_workers():
@@ -18,328 +35,651 @@ def get_max_workers():
     return min(2 * cpu_count, 10000)
 
 
-async def fetch_url(url, session):
+async def fetch_url(url, session, scheduler=None, cache=None, retry=None):
     """Fetch a URL using aiohttp asynchronously."""
+    async def fetch_once(revalidate=True):
+        async with request_slot(scheduler, 'html'):
+            headers = cache.conditional_headers(url) if cache and revalidate else None
+            try:
+                request_start = time.time()
+                async with session.get(url, headers=headers) as response:
+                    if scheduler:
+                        scheduler.record_response(response.status, time.time() - request_start)
+
+                    # Unchanged since the last run, serve the body from the cache
+                    if headers and response.status == 304:
+                        return cache.load_text(url, time.time() - request_start)
+
+                    response.raise_for_status()
+                    html = await response.text()
+                    if cache:
+                        cache.store(url, response.headers, await response.read(), response.get_encoding(), time.time() - request_start)
+                    return html
+            except CacheMiss:
+                pass
+            finally:
+                if headers:
+                    cache.release(url)
+        # The cached body went away while the request was out, ask again without validators
+        return await fetch_once(revalidate=False)
+
     try:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            return await response.text()
-    except aiohttp.ClientError as err:
-        print(f"Error fetching {url}: {err}")
+        # The slot is released between attempts, so backoff doesn't hold up other requests
+        return await (retry.run(url, fetch_once) if retry else fetch_once())
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as err:
+        print(f"Error fetching {url}: {err or type(err).__name__}")
         return None
 
 
-async def download_image(url, folder, session):
-    """Download image and save to folder."""
-    try:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            image_data = await response.read()
+def get_image_path(url, folder):
+    """Return the local path of an image, named after the filename in its URL."""
+    return os.path.join(folder, os.path.basename(urlparse(url).path))
 
-            # Parse the image filename from the URL
-            parsed_url = urlparse(url)
-            image_name = os.path.basename(parsed_url.path)
 
-            # Ensure the folder exists
-            os.makedirs(folder, exist_ok=True)
+async def download_image(url, folder, session, scheduler=None, cache=None, retry=None):
+    """Download image and save to folder.
 
-            # Save the image to the folder
-            image_path = os.path.join(folder, image_name)
-            async with aiofiles.open(image_path, 'wb') as img_file:
-                await img_file.write(image_data)
+    The body is streamed to a temporary file under ./images/.partial in
+    IMAGE_CHUNK_SIZE chunks and renamed into place once it is complete, so
+    memory use doesn't depend on image size and no partial file ever ends up
+    in the image folder.
+    """
+    image_path = get_image_path(url, folder)
+    partial_folder = os.path.join(os.path.dirname(os.path.normpath(folder)), '.partial')
 
-            return image_path
-    except aiohttp.ClientError as err:
-        print(f"Error downloading image {url}: {err}")
+    async def download_once(revalidate=True):
+        async with request_slot(scheduler, 'image'):
+            headers = cache.conditional_headers(url) if cache and revalidate else None
+            try:
+                request_start = time.time()
+                async with session.get(url, headers=headers) as response:
+                    if scheduler:
+                        scheduler.record_response(response.status, time.time() - request_start)
+                    revalidated = headers and response.status == 304
+                    if not revalidated:
+                        response.raise_for_status()
+
+                    os.makedirs(partial_folder, exist_ok=True)
+                    temp_fd, temp_path = tempfile.mkstemp(dir=partial_folder, suffix='.part')
+                    os.close(temp_fd)
+                    try:
+                        if revalidated:
+                            cache.copy_to(url, temp_path, time.time() - request_start)
+                        else:
+                            bytes_written = 0
+                            async with aiofiles.open(temp_path, 'wb') as img_file:
+                                async for chunk in response.content.iter_chunked(IMAGE_CHUNK_SIZE):
+                                    await img_file.write(chunk)
+                                    bytes_written += len(chunk)
+
+                            # A short body means the connection dropped mid-download
+                            if response.content_length is not None and 'Content-Encoding' not in response.headers \
+                                    and bytes_written != response.content_length:
+                                raise aiohttp.ClientPayloadError(
+                                    f"expected {response.content_length} bytes, got {bytes_written}")
+
+                            if cache:
+                                cache.store_file(url, response.headers, temp_path, time.time() - request_start)
+
+                        # Ensure the folder exists and move the finished file into it
+                        os.makedirs(folder, exist_ok=True)
+                        os.replace(temp_path, image_path)
+                    finally:
+                        if os.path.exists(temp_path):
+                            os.remove(temp_path)
+
+                    return image_path
+            except CacheMiss:
+                pass
+            finally:
+                if headers:
+                    cache.release(url)
+        # The cached body went away while the request was out, download it again without validators
+        return await download_once(revalidate=False)
+
+    try:
+        return await (retry.run(url, download_once) if retry else download_once())
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as err:
+        print(f"Error downloading image {url}: {err or type(err).__name__}")
         return None
 
 
-def remove_accents(input_str):
-    """Remove accents from the input string."""
-    nfkd_form = unicodedata.normalize('NFD', input_str)
-    return re.sub(r'[\u0300-\u036f]', '', nfkd_form).replace('đ', 'd').replace('Đ', 'D')
+async def scrape_product_details(product_url, product_id, session, parser='bs4', variation_cache=None, **fetch_options):
+    """Fetch product details from the product detail page asynchronously.
 
+    Variations the page doesn't embed (too many for the AJAX threshold) are
+    resolved through ?wc-ajax=get_variation, reusing `variation_cache`.
+    """
+    html = await fetch_url(product_url, session, **fetch_options)
+    if not html:
+        return {}
 
-def generate_product_sku(product_name):
-    """Generate product SKU from product name."""
-    product_sku = re.sub(r'[^\w\s]', '', product_name).lower().replace(' ', '_')
-    return remove_accents(product_sku)
+    product_details = await extract(parser, 'parse_product', html, product_id, product_url)
+    variation_lookup = product_details.pop('variation_lookup', None)
+    if variation_lookup:
+        variations = await resolve_variations(product_url, variation_lookup, session, product_details.get('price', 0), variation_cache, **fetch_options)
+        product_details['variations'] = attribute_option_variations(variations, variation_lookup['attributes'], product_details.get('price', 0))
+        product_details['variation_matrix'] = build_variation_matrix(variations)
+    return product_details
 
 
-async def scrape_product_details(product_url, product_id, session):
-    """Fetch product details from the product detail page asynchronously."""
-    html = await fetch_url(product_url, session)
-    if not html:
-        return {}
+async def complete_store_record(product, session, parser='bs4', variation_cache=None, **fetch_options):
+    """Finish a Store API record, scraping the HTML only for what the API lacks."""
+    detailed_product = product.pop('store_record')
+    if not detailed_product.get('product_name'):
+        return await scrape_product_details(product['product_url'], product['product_id'], session, parser, variation_cache, **fetch_options)
 
-    soup = BeautifulSoup(html, 'html.parser')
-    product_details = {'product_id': product_id}
-
-    # Get the product name
-    product_name_tag = soup.find('h1', class_='product-title')
-    if product_name_tag:
-        product_details['product_name'] = product_name_tag.text.strip()
-
-        # Generate product SKU based on product name
-        product_details['product_sku'] = generate_product_sku(product_details['product_name'])
-
-
-    # Get the price (for simple products)
-    price_tag = soup.find('p', class_='price')
-    product_details['price'] = 0
-    product_details['special_price'] = 0
-    base_price = 0
-
-    if price_tag:
-        # Check if the product has a special price (on sale)
-        regular_price_tag = price_tag.find('del')
-        special_price_tag = price_tag.find('ins')
-
-        # Extract the regular price if available
-        if regular_price_tag:
-            regular_price = regular_price_tag.find('bdi').text.strip()
-            product_details['price'] = int(regular_price.split('₫')[0].replace('.', '').replace(',', '').strip() or 0)
-
-        # Extract the special price if available
-        if special_price_tag:
-            special_price = special_price_tag.find('bdi').text.strip()
-            product_details['special_price'] = int(special_price.split('₫')[0].replace('.', '').replace(',', '').strip() or 0)
-
-        # If no regular price is found, use the main price as the regular price
-        if product_details['price'] == 0 and price_tag.find('bdi'):
-            main_price = price_tag.find('bdi').text.strip()
-            product_details['price'] = int(main_price.split('₫')[0].replace('.', '').replace(',', '').strip() or 0)
-
-    # Determine if the price is a single price or a range
-    base_price = product_details['price']
-
-    # Get the product short description (including HTML formatting for CKEditor)
-    short_description_tag = soup.find('div', class_='product-short-description')
-    if short_description_tag:
-        product_details['short_description'] = str(short_description_tag)  # Save HTML as a string
-
-    # Get product categories
-    category_tags = soup.find('span', class_='posted_in')
-    categories = []
-    if category_tags:
-        for category_tag in category_tags.find_all('a', rel='tag'):
-            categories.append(category_tag.text.strip())
-        product_details['category'] = ', '.join(categories)
-
-    description_panel = soup.find('div', class_='woocommerce-Tabs-panel--description')
-    if description_panel:
-        # Extract the content while keeping HTML structure
-        description_content = description_panel.decode_contents().strip()
-
-        # Store the content in the product details with the key 'description'
-        product_details['description'] = description_content
-
-    # Check if product is configurable and gather variations
-    variation_form = soup.find('form', class_='variations_form cart')
-    if variation_form:
-        product_details['product_type'] = 'configurable'
-        product_details['variations'] = []
-
-        # Extract variation details from the JSON data in the form
-        variations_data = variation_form.get('data-product_variations')
-        attribute_price_map = {}
-        if variations_data:
-            try:
-                variations = json.loads(variations_data)
-                for variation in variations:
-                    if 'display_price' in variation and 'attributes' in variation:
-                        price = variation['display_price']
-                        for attribute, value in variation['attributes'].items():
-                            attribute_code = attribute.replace('attribute_pa_', '')
-                            if attribute_code not in attribute_price_map:
-                                attribute_price_map[attribute_code] = {}
-                            attribute_price_map[attribute_code][value] = price
-            except json.JSONDecodeError as e:
-                print(f"Error parsing variations data for {product_url}: {e}")
-
-        # Parse variation attributes from the HTML
-        table_variations = soup.find_all('table', class_='variations')
-        for table in table_variations:
-            for row in table.find_all('tr'):
-                label = row.find('label')
-                select = row.find('select')
-                if label and select:
-                    attribute_name = label.text.strip()
-                    attribute_code = select.get('name', '').replace('attribute_pa_', '')
-
-                    options = []
-                    for option in select.find_all('option'):
-                        option_value = option.get('value', '')
-                        option_text = option.text.strip()
-
-                        # Skip default option with empty value
-                        if option_value:  
-                            # Get the display text for the option
-                            # Fetch the price from the attribute_price_map if available
-                            option_price = attribute_price_map.get(attribute_code, {}).get(option_value, 0)
-
-                            # If option_price is 0 and the product has a single base price, use the base price
-                            if option_price == 0 and base_price > 0:
-                                option_price = base_price
-
-                            options.append({
-                                'attribute_option_code': option_text,
-                                'attribute_option_price': option_price
-                            })
-
-                    if options:
-                        product_details['variations'].append({
-                            'attribute_name': attribute_name,
-                            'attribute_code': attribute_code,
-                            'options': options
-                        })
-    else:
-        product_details['product_type'] = 'simple'
-        product_details['variations'] = None  # Set variations to null for simple products
+    detailed_product['product_sku'] = generate_product_sku(detailed_product['product_name'])
 
-    return product_details
+    # The Store API has no per-variation prices, read them from the product page
+    if detailed_product['product_type'] == 'configurable':
+        html_details = await scrape_product_details(product['product_url'], product['product_id'], session, parser, variation_cache, **fetch_options)
+        detailed_product['variations'] = html_details.get('variations') or []
+        detailed_product['variation_matrix'] = html_details.get('variation_matrix')
 
+    return detailed_product
 
-async def scrape_page(url, start_product_id, session):
-    """Fetch and parse a single page of products asynchronously."""
-    html = await fetch_url(url, session)
-    if not html:
-        return [], None, start_product_id  # Return empty list, no next page, and unchanged product_id
 
-    soup = BeautifulSoup(html, 'html.parser')
+async def scrape_listed_product(product, session, incremental=None, parser='bs4', variation_cache=None, sanitizer=None, **fetch_options):
+    """Fetch the details of a listing tile, or reuse last run's record when the tile is unchanged.
 
-    # Find the main product list container
-    products_container = soup.find('div', class_='products')
-    if not products_container:
-        return [], None, start_product_id  # No products found, return empty list, no next page, and unchanged product_id
+    With a `sanitizer`, the description HTML is stripped of non-rendering
+    markup before the record is used or remembered.
 
-    products = []
-    product_id = start_product_id  # Initialize product ID for this page
+    Returns the detail record and whether it was carried forward.
+    """
+    carried = False
+    if 'store_record' in product:
+        # Already fetched in bulk from the Store API, there's nothing to save by carrying it forward
+        detailed_product = await complete_store_record(product, session, parser, variation_cache, **fetch_options)
+    else:
+        detailed_product = incremental.carry_forward(product) if incremental else None
+        if detailed_product:
+            carried = True
+        else:
+            detailed_product = await scrape_product_details(product['product_url'], product['product_id'], session, parser, variation_cache, **fetch_options)
 
-    # Iterate over each product block
-    for product_item in products_container.find_all('div', class_='product-small', recursive=False):
-        product_data = {'product_id': product_id}  # Assign product ID
-        
-        # Get product name and URL
-        product_name_tag = product_item.find('p', class_='name product-title woocommerce-loop-product__title')
-        if product_name_tag and product_name_tag.find('a'):
-            product_url = product_name_tag.find('a')['href']
-            product_data['product_url'] = product_url  # Store product URL for later fetching
+    # Sitemap entries may not list an image, take it from the product page instead
+    if detailed_product and not product.get('image_url') and detailed_product.get('image_url'):
+        product['image_url'] = detailed_product['image_url']
 
-            # Get the image URL
-            product_image_tag = product_item.find('img')
-            if product_image_tag:
-                product_data['image_url'] = product_image_tag['src']
+    if sanitizer and detailed_product:
+        sanitizer.sanitize_record(detailed_product)
 
-            products.append(product_data)
-            product_id += 1  # Increment product ID
+    if incremental and detailed_product and not carried:
+        incremental.remember(product, detailed_product)
+    return detailed_product, carried
 
-    # Check for pagination and next page
-    next_page_link = soup.find('a', class_='next page-number')
-    next_page_url = next_page_link['href'] if next_page_link else None
 
-    return products, next_page_url, product_id  # Return the updated product_id
+def needs_image_download(product, detailed_product, carried):
+    """Unchanged products keep their image unless it is missing on disk."""
+    if not carried:
+        return True
+    return not os.path.exists(get_image_path(product['image_url'], f"./images/{detailed_product['product_sku']}"))
 
-async def crawl_wordpress_products(base_url, max_workers=None):
-    """Crawl all products from the shop until the last page asynchronously."""
-    start_time = time.time()  # Record the start time
 
-    products = []
-    current_url = base_url
-    all_product_data = []
-    start_product_id = 1  # Start product ID from 1
+def build_page_url(base_url, page_number):
+    """Build the URL of a numbered listing page (/shop/page/N/)."""
+    if page_number <= 1:
+        return base_url
+    return urljoin(base_url if base_url.endswith('/') else base_url + '/', f'page/{page_number}/')
 
-    if max_workers is None:
-        max_workers = get_max_workers()
 
-    print(f"Using {max_workers} workers...")
+async def scrape_page(url, start_product_id, session, parser='bs4', **fetch_options):
+    """Fetch and parse a single page of products asynchronously."""
+    html = await fetch_url(url, session, **fetch_options)
+    if not html:
+        return [], None, start_product_id  # Return empty list, no next page, and unchanged product_id
+
+    page_products, next_page_url, product_id, _ = await extract(parser, 'parse_listing', html, start_product_id)
+    return page_products, next_page_url, product_id
+
 
-    async with aiohttp.ClientSession() as session:
-        print("Starting to scrape pages...")
-        pbar = tqdm(total=None, desc="Scraping Pages", unit="page")
+async def iter_listing_pages_serial(base_url, session, parser='bs4', start_page=1, start_product_id=1, **fetch_options):
+    """Walk the listing pages one at a time by following the next page link.
+
+    `start_page` and `start_product_id` pick up an interrupted walk.
+    """
+    current_url = build_page_url(base_url, start_page)
+
+    pbar = tqdm(total=None, desc="Scraping Pages", unit="page")
+    try:
         while current_url:
             try:
-                page_products, next_page_url, start_product_id = await scrape_page(current_url, start_product_id, session)
-                
-                for product in page_products:
-                    all_product_data.append(product)
-
-                pbar.update(1)
-                pbar.set_postfix_str(f"Current URL: {current_url}")
-                
-                current_url = next_page_url  # Move to the next page if available
+                page_products, next_page_url, start_product_id = await scrape_page(current_url, start_product_id, session, parser, **fetch_options)
             except Exception as e:
                 print(f"\nError scraping page {current_url}: {e}")
                 break  # Stop scraping if an error occurs
+
+            pbar.update(1)
+            pbar.set_postfix_str(f"Current URL: {current_url}")
+            yield page_products
+
+            current_url = next_page_url  # Move to the next page if available
+    finally:
+        pbar.close()
+
+
+async def iter_listing_pages_parallel(base_url, session, prefetch_pages=4, parser='bs4', start_page=1, start_product_id=1, **fetch_options):
+    """Fetch all listing pages concurrently using the page count from the first page.
+
+    If the first page has no usable pagination block, pages are prefetched
+    speculatively `prefetch_pages` at a time until one of them comes back empty
+    or without a next page link. Pages are yielded in page order as soon as
+    every page before them has finished, so product IDs stay deterministic.
+    A failed page within a known page range is yielded empty, so every
+    yielded page stands for one page number from `start_page` on.
+    """
+    html = await fetch_url(build_page_url(base_url, start_page), session, **fetch_options)
+    if not html:
+        return
+
+    first_products, next_page_url, product_id, last_page = await extract(parser, 'parse_listing', html, start_product_id)
+    if not next_page_url:
+        yield first_products
+        return
+
+    pbar = tqdm(total=last_page, initial=start_page - 1, desc="Scraping Pages", unit="page")
+    pbar.update(1)
+
+    async def fetch_listing_page(page_number):
+        page_url = build_page_url(base_url, page_number)
+        try:
+            page_products, page_next_url, _ = await scrape_page(page_url, 1, session, parser, **fetch_options)
+        except Exception as e:
+            print(f"\nError scraping page {page_url}: {e}")
+            page_products, page_next_url = [], None
+        pbar.update(1)
+        return page_products, page_next_url
+
+    pending = {}
+    try:
+        yield first_products
+
+        if last_page:
+            pending = {n: asyncio.create_task(fetch_listing_page(n)) for n in range(start_page + 1, last_page + 1)}
+            page_numbers = range(start_page + 1, last_page + 1)
+        else:
+            page_numbers = itertools.count(start_page + 1)
+
+        for page_number in page_numbers:
+            if page_number not in pending:
+                # Page count unknown, speculatively fetch a window of pages ahead
+                for n in range(page_number, page_number + prefetch_pages):
+                    pending[n] = asyncio.create_task(fetch_listing_page(n))
+
+            page_products, page_next_url = await pending.pop(page_number)
+            if not page_products:
+                if last_page:
+                    yield page_products  # A failed page doesn't end a known page range
+                    continue
+                break
+
+            # Pages finish out of order, so assign product IDs by page order here
+            for product in page_products:
+                product['product_id'] = product_id
+                product_id += 1
+            yield page_products
+
+            if not last_page and not page_next_url:
+                break
+    finally:
+        for task in pending.values():
+            task.cancel()
         pbar.close()
 
-        print(f"\nFetching details for {len(all_product_data)} products concurrently...")
-        detailed_products = []
-        tasks = [scrape_product_details(p['product_url'], p['product_id'], session) for p in all_product_data]
-        
-        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Fetching Product Details", unit="product"):
-            detailed_product = await task
+
+def iter_listing_pages(base_url, session, parallel_listing=True, parser='bs4', start_page=1, start_product_id=1, **fetch_options):
+    """Yield the product tiles of every listing page in page order, from `start_page` on."""
+    if parallel_listing:
+        return iter_listing_pages_parallel(base_url, session, parser=parser, start_page=start_page, start_product_id=start_product_id, **fetch_options)
+    return iter_listing_pages_serial(base_url, session, parser, start_page, start_product_id, **fetch_options)
+
+
+async def iter_store_api_pages(base_url, session, parallel_listing=True, parser='bs4', **fetch_options):
+    """Yield products from the Store API, or from the listing pages if the API has none."""
+    found_products = False
+    async for page_products in iter_store_api_products(base_url, session, **fetch_options):
+        found_products = found_products or bool(page_products)
+        yield page_products
+
+    if not found_products:
+        print("Store API returned no products, falling back to the listing pages...")
+        async for page_products in iter_listing_pages(base_url, session, parallel_listing, parser, **fetch_options):
+            yield page_products
+
+
+def show_concurrency_limit(pbar, scheduler):
+    """Show the adaptive concurrency limit next to a progress bar."""
+    if scheduler and scheduler.limiter:
+        pbar.set_postfix(limit=scheduler.current_limit(), refresh=False)
+
+
+async def run_staged_crawl(product_pages, session, incremental=None, parser='bs4', variation_cache=None, sanitizer=None, sinks=(), journal=None, **fetch_options):
+    """Crawl listing pages, then product details, then images, one stage after another.
+
+    Product records are written to `sinks` as soon as their details are in.
+    Products and images the `journal` has as done are skipped.
+    """
+    print("Starting to scrape pages...")
+    all_product_data = []
+    async for page_products in product_pages:
+        all_product_data.extend(page_products)
+
+    print(f"\nFetching details for {len(all_product_data)} products concurrently...")
+    id_to_sku = {}
+    carried_ids = set()
+    if journal:
+        # Finished before the interruption, only their images may be left
+        for p in all_product_data:
+            if journal.is_done(p) and incremental:
+                incremental.restore(p, journal.state_entry(p))
+            if journal.is_done(p) and journal.pending_image(p):
+                id_to_sku[p['product_id']] = journal.pending_image(p)[1]
+        all_product_data = [p for p in all_product_data if not journal.is_done(p) or p['product_id'] in id_to_sku]
+    tasks = [scrape_listed_product(p, session, incremental, parser, variation_cache, sanitizer, **fetch_options) for p in all_product_data if p['product_id'] not in id_to_sku]
+    product_by_id = {p['product_id']: p for p in all_product_data}
+    
+    pbar = tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Fetching Product Details", unit="product")
+    for task in pbar:
+        detailed_product, carried = await task
+        show_concurrency_limit(pbar, fetch_options.get('scheduler'))
+        if not detailed_product:
+            continue
+
+        # Map product_id to product_sku for the image folders
+        if 'product_sku' in detailed_product:
+            id_to_sku[detailed_product['product_id']] = detailed_product['product_sku']
+        if carried:
+            carried_ids.add(detailed_product['product_id'])
+
+        # Products are exported with the image URL of their listing tile, or none when nothing lists one
+        listed_product = product_by_id.get(detailed_product['product_id'])
+        if listed_product:
+            detailed_product['image_url'] = listed_product.get('image_url', '')
+            for sink in sinks:
+                sink.write(detailed_product, listed_product['product_url'])
+            if journal:
+                journal.product_written(listed_product, detailed_product, sinks, incremental.entry(listed_product) if incremental else None)
+
+    # Download product images concurrently
+    print("Downloading product images...")
+
+    async def download_product_image(image_url, product_sku):
+        image_path = await download_image(image_url, f"./images/{product_sku}", session, **fetch_options)
+        if image_path and journal:
+            journal.image_done(image_url)
+        return image_path
+
+    image_tasks = []
+    for product in all_product_data:
+        if 'image_url' in product and product['product_id'] in id_to_sku:
+            product_sku = id_to_sku[product['product_id']]
+            image_url = product['image_url']
+            if not needs_image_download(product, {'product_sku': product_sku}, product['product_id'] in carried_ids):
+                continue
+            if journal and journal.has_image(image_url):
+                continue
+            image_tasks.append(download_product_image(image_url, product_sku))
+    
+    downloaded_images = []
+    pbar = tqdm(asyncio.as_completed(image_tasks), total=len(image_tasks), desc="Downloading Images", unit="image")
+    for task in pbar:
+        result = await task
+        show_concurrency_limit(pbar, fetch_options.get('scheduler'))
+        if result:
+            downloaded_images.append(result)
+
+    print(f"Successfully downloaded {len(downloaded_images)} images.")
+
+    # Add the image optimization step here
+    print("Optimizing downloaded images...")
+    optimized_images = await run_optimization("./images", "./optimized_images")
+    print(f"Successfully optimized {len(optimized_images)} images.")
+
+
+async def run_streaming_pipeline(product_pages, session, scheduler, queue_size=None, incremental=None, parser='bs4', variation_cache=None, sanitizer=None, sinks=(), journal=None, **fetch_options):
+    """Crawl with the listing, detail, image and optimization stages connected by bounded queues.
+
+    Each product moves on to the next stage as soon as the previous one is done
+    with it, so the stages overlap instead of waiting for each other to finish.
+    Product records are written to `sinks` as soon as their details are in.
+    Products and images the `journal` has as done are skipped.
+    """
+    detail_workers = scheduler.max_pages
+    image_workers = scheduler.max_images
+    optimize_workers = os.cpu_count() or 1
+
+    detail_queue = asyncio.Queue(maxsize=queue_size or 2 * detail_workers)
+    image_queue = asyncio.Queue(maxsize=queue_size or 2 * image_workers)
+    optimize_queue = asyncio.Queue(maxsize=queue_size or 2 * optimize_workers)
+
+    counts = {'images': 0, 'optimized': 0}
+    detail_bar = tqdm(desc="Fetching Product Details", unit="product")
+    image_bar = tqdm(desc="Downloading Images", unit="image")
+    optimize_bar = tqdm(desc="Optimizing Images", unit="image")
+
+    async def list_products():
+        async for page_products in product_pages:
+            for product in page_products:
+                await detail_queue.put(product)
+        for _ in range(detail_workers):
+            await detail_queue.put(None)
+
+    async def fetch_details():
+        while (product := await detail_queue.get()) is not None:
+            if journal and journal.is_done(product):
+                # Finished before the interruption, only its image may be left
+                detail_bar.update(1)
+                if incremental:
+                    incremental.restore(product, journal.state_entry(product))
+                if journal.pending_image(product):
+                    await image_queue.put(journal.pending_image(product))
+                continue
+
+            detailed_product, carried = await scrape_listed_product(product, session, incremental, parser, variation_cache, sanitizer, scheduler=scheduler, **fetch_options)
+            detail_bar.update(1)
+            show_concurrency_limit(detail_bar, scheduler)
             if detailed_product:
-                detailed_products.append(detailed_product)
-
-        # Create a dictionary to map product_id to product_sku
-        id_to_sku = {p['product_id']: p['product_sku'] for p in detailed_products if 'product_sku' in p}
-
-        # Download product images concurrently
-        print("Downloading product images...")
-        image_tasks = []
-        for product in all_product_data:
-            if 'image_url' in product and product['product_id'] in id_to_sku:
-                product_sku = id_to_sku[product['product_id']]
-                image_url = product['image_url']
-                image_tasks.append(download_image(image_url, f"./images/{product_sku}", session))
-        
-        downloaded_images = []
-        for task in tqdm(asyncio.as_completed(image_tasks), total=len(image_tasks), desc="Downloading Images", unit="image"):
-            result = await task
-            if result:
-                downloaded_images.append(result)
-
-        print(f"Successfully downloaded {len(downloaded_images)} images.")
-
-        # Add the image optimization step here
-        print("Optimizing downloaded images...")
-        optimized_images = await run_optimization("./images", "./optimized_images")
-        print(f"Successfully optimized {len(optimized_images)} images.")
-
-    # Combine product data with image URLs and detailed information
-    # Map product_id to image_url for accurate assignment
-    product_id_to_image_url = {p['product_id']: p['image_url'] for p in all_product_data}
-
-    final_products = []
-    for detailed_product in detailed_products:
-        if detailed_product and detailed_product['product_id'] in product_id_to_image_url:
-            detailed_product['image_url'] = product_id_to_image_url[detailed_product['product_id']]
-            final_products.append(detailed_product)
-
-    # Ensure all products have the same fields
-    seen = set()
-    unique_products = []
-    for product in final_products:
-        product_key = product['product_id']
-        if product_key not in seen:
-            seen.add(product_key)
-            unique_products.append(product)
-
-    # Export products to CSV
-    with open('products.csv', mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=['product_id', 'product_name', 'product_sku', 'category', 'price', 'special_price', 'description', 'short_description', 'image_url', 'product_type', 'variations'])
-        writer.writeheader()
-        for product in unique_products:
-            # Convert variations to JSON string for CSV export
-            if isinstance(product['variations'], list):
-                product['variations'] = json.dumps(product['variations'])
-            # Ensure price and special_price are integers
-            product['price'] = int(product['price'])
-            product['special_price'] = int(product['special_price'])
-            writer.writerow(product)
-
-    print(f"Extracted {len(unique_products)} unique products. Data exported to products.csv")
+                # Products without an image anywhere are still written, they only skip the image stages
+                detailed_product['image_url'] = product.get('image_url', '')
+                for sink in sinks:
+                    sink.write(detailed_product, product['product_url'])
+                if journal:
+                    journal.product_written(product, detailed_product, sinks, incremental.entry(product) if incremental else None)
+
+                # The image folder is named after the SKU, so the download can start now
+                if product.get('image_url') and 'product_sku' in detailed_product and needs_image_download(product, detailed_product, carried) \
+                        and not (journal and journal.has_image(product['image_url'])):
+                    await image_queue.put((product['image_url'], detailed_product['product_sku']))
+
+    async def download_images():
+        while (item := await image_queue.get()) is not None:
+            image_url, product_sku = item
+            image_path = await download_image(image_url, f"./images/{product_sku}", session, scheduler=scheduler, **fetch_options)
+            image_bar.update(1)
+            show_concurrency_limit(image_bar, scheduler)
+            if image_path:
+                counts['images'] += 1
+                await optimize_queue.put((image_url, image_path, f"./optimized_images/{product_sku}"))
+
+    async def optimize_images():
+        while (item := await optimize_queue.get()) is not None:
+            image_url, image_path, output_folder = item
+            # Pillow work is CPU bound, keep it off the event loop
+            optimized_path = await asyncio.to_thread(optimize_image_sync, image_path, output_folder)
+            optimize_bar.update(1)
+            if optimized_path:
+                counts['optimized'] += 1
+                if journal:
+                    journal.image_done(image_url)
+
+    async def run_stage(worker, worker_count, next_queue=None, next_worker_count=0):
+        """Run a stage's workers, then tell the next stage's workers to stop."""
+        await asyncio.gather(*(worker() for _ in range(worker_count)))
+        for _ in range(next_worker_count):
+            await next_queue.put(None)
+
+    await asyncio.gather(
+        list_products(),
+        run_stage(fetch_details, detail_workers, image_queue, image_workers),
+        run_stage(download_images, image_workers, optimize_queue, optimize_workers),
+        run_stage(optimize_images, optimize_workers),
+    )
+
+    for pbar in (detail_bar, image_bar, optimize_bar):
+        pbar.close()
+    print(f"Successfully downloaded {counts['images']} images.")
+    print(f"Successfully optimized {counts['optimized']} images.")
+
+
+async def crawl_wordpress_products(base_url, max_workers=None, parallel_listing=True, streaming=True, cache_dir=None, incremental_state=None, max_attempts=4, adaptive=True, discovery='listing', sitemap_url=None, parser='bs4', process_parsing=False, variation_cache_path=None, sanitize_html=True, template_slicing=False, jsonld_fast_path=False, outputs=('products.csv', 'products.json'), journal_path='crawl_journal.jsonl', resume=False, catalog_path=None):
+    """Crawl all products from the shop until the last page asynchronously.
+
+    With discovery='sitemap', product URLs come from the product sitemaps
+    under `sitemap_url` (default /sitemap_index.xml) instead of the listing
+    pages. Together with `incremental_state`, products whose <lastmod> is
+    older than the last successful crawl are carried forward without a fetch.
+
+    With discovery='store_api', products are read in bulk from the
+    WooCommerce Store API and only configurable products get an HTML fetch,
+    for their variation prices.
+
+    With `adaptive` concurrency, `max_workers` is the ceiling and the actual
+    limit follows the site's latency and 429/503 responses.
+
+    `parser` picks the HTML parser backend: 'bs4' (html.parser, the
+    default), 'bs4-partial' (only builds the product regions of product
+    pages), 'lxml' or 'selectolax'. All of them extract the same records,
+    see parsers.check_parity. With `process_parsing`, product and listing
+    pages are parsed in a pool of worker processes (one per core) so parsing
+    never blocks the event loop that does the fetching. With
+    `template_slicing`, the Flatsome header, menus and footer shared by every
+    page are learned from the first few pages and cut off before parsing,
+    see template_slicing.TemplateSlicer. With `jsonld_fast_path`, the
+    product fields the page's JSON-LD carries are read from it and the DOM
+    only for the rest, see ParserBackend.parse_product_jsonld.
+
+    Pass `cache_dir` to keep an on-disk HTTP cache between runs, so unchanged
+    pages and images come back as 304s. Pass `incremental_state` (a JSON file
+    path) to only fetch products whose listing tile changed since that run.
+    Pass `variation_cache_path` (a JSON file path) to keep the variations of
+    products that are only available over AJAX, so the next run only asks
+    for the attribute combinations it hasn't seen.
+
+    With `sanitize_html`, descriptions are exported without the Google Sheets
+    paste attributes, comments and other markup that doesn't render, see
+    sanitize.SanitizingParser.
+
+    `outputs` are the files products are written to as they finish, CSV
+    (products.csv), a JSON array (products.json) or JSON Lines (.jsonl).
+    The JSON outputs hold typed records straight from the crawl, nested
+    variations and integer prices and IDs included, so they don't need
+    convert_csv_to_json.py. Each is written as <path>.part, which can be
+    tailed during the crawl, and moved into place at the end; a crashed run
+    leaves the .part files with everything finished so far.
+
+    Progress is journaled to `journal_path` as the crawl goes. With `resume`,
+    an interrupted crawl continues from its journal: listing pages, products
+    and images that were done aren't fetched again, and the outputs are
+    appended to. The journal is removed once a crawl completes.
+
+    With a `catalog_path`, products are also upserted into that SQLite
+    catalog (see catalog.CatalogStore) under their product URL, merging the
+    run with the ones before it.
+    """
+    start_time = time.time()  # Record the start time
+
+    if max_workers is None:
+        max_workers = get_max_workers()
+
+    scheduler = CrawlScheduler(max_workers, adaptive=adaptive)
+    print(f"Using {scheduler.describe()}...")
+
+    cache = HttpCache(cache_dir) if cache_dir else None
+    incremental = IncrementalState(incremental_state) if incremental_state else None
+    retry = RetryPolicy(max_attempts=max_attempts)
+    variation_cache = VariationCache(variation_cache_path) if variation_cache_path else None
+    sanitizer = HtmlSanitizer() if sanitize_html else None
+    journal = CrawlJournal(journal_path, outputs, resume)
+    if journal.resumed:
+        print(f"Resuming from {journal_path} with {journal.describe()} done...")
+        if incremental and journal.started_at:
+            incremental.resume_run(journal.started_at)
+    sinks = [open_sink(output, **journal.sink_options(output)) for output in outputs]
+    catalog = CatalogStore(catalog_path) if catalog_path else None
+    if catalog:
+        sinks.append(catalog)
+
+    # Parse in worker processes, one per core
+    parse_pool = ParsePool(parser) if process_parsing else None
+    if parse_pool:
+        parser = parse_pool
+    slicer = TemplateSlicer(parser) if template_slicing else None
+    if slicer:
+        parser = slicer
+    fast_path = JsonLdFastPath(parser) if jsonld_fast_path else None
+    if fast_path:
+        parser = fast_path
+
+    if fast_path or slicer or parse_pool:
+        print(f"Parsing HTML with the {(fast_path or slicer or parse_pool).describe()}...")
+    else:
+        print(f"Parsing HTML with the {get_backend(parser).name} backend...")
+
+    async with aiohttp.ClientSession(connector=scheduler.make_connector()) as session:
+        if discovery == 'sitemap':
+            sitemap_url = sitemap_url or urljoin(base_url, '/sitemap_index.xml')
+            print(f"Discovering products from {sitemap_url}...")
+            product_pages = iter_sitemap_products(sitemap_url, session, skip_urls={base_url}, scheduler=scheduler, retry=retry)
+        elif discovery == 'store_api':
+            product_pages = iter_store_api_pages(base_url, session, parallel_listing, parser, scheduler=scheduler, cache=cache, retry=retry)
+        else:
+            product_pages = iter_listing_pages(base_url, session, parallel_listing, parser, journal.next_page, journal.next_product_id, scheduler=scheduler, cache=cache, retry=retry)
+
+        # Sitemap and Store API discovery can't start at a given page, they skip the journaled ones instead
+        product_pages = journal.track_pages(product_pages, skip_pages=len(journal.pages) if discovery in ('sitemap', 'store_api') else 0)
+
+        try:
+            if streaming:
+                await run_streaming_pipeline(product_pages, session, scheduler, incremental=incremental, parser=parser, variation_cache=variation_cache, sanitizer=sanitizer, sinks=sinks, journal=journal, cache=cache, retry=retry)
+            else:
+                await run_staged_crawl(product_pages, session, incremental=incremental, parser=parser, variation_cache=variation_cache, sanitizer=sanitizer, sinks=sinks, journal=journal, scheduler=scheduler, cache=cache, retry=retry)
+        except BaseException:
+            # Keep what was written so far in the .part files, journaled for --resume
+            journal.checkpoint(sinks)
+            journal.close()
+            for sink in sinks:
+                sink.close(finalize=False)
+            raise
+        finally:
+            if cache:
+                cache.save()
+            if variation_cache:
+                variation_cache.save()
+            if parse_pool:
+                parse_pool.shutdown()
+
+    scheduler.report()
+    retry.report()
+    if cache:
+        cache.report()
+    if variation_cache:
+        variation_cache.report()
+    if sanitizer:
+        sanitizer.report()
+    if slicer:
+        slicer.report()
+    if fast_path:
+        fast_path.report()
+    if incremental:
+        incremental.save()
+        incremental.report()
+
+    for sink in sinks:
+        sink.close()
+        print(f"Extracted {sink.written} unique products. Data exported to {sink.path}")
+    journal.close(completed=True)
 
     end_time = time.time()  # Record the end time
     total_time = end_time - start_time  # Calculate the total duration
@@ -347,5 +687,40 @@ async def crawl_wordpress_products(base_url, max_workers=None):
 
 
 if __name__ == "__main__":
-    shop_url = 'https://tinnha.vn/shop/'
-    asyncio.run(crawl_wordpress_products(shop_url))
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Crawl every product of the shop into products.csv and products.json.")
+    arg_parser.add_argument('shop_url', nargs='?', default='https://tinnha.vn/shop/')
+    arg_parser.add_argument('--resume', action='store_true', help="Continue an interrupted crawl from its journal instead of starting over")
+    arg_parser.add_argument('--journal', default='crawl_journal.jsonl')
+    arg_parser.add_argument('--output', action='append', dest='outputs', help="File to write products to, .csv, .json or .jsonl, can be repeated (default: products.csv and products.json)")
+    arg_parser.add_argument('--catalog', help="Also upsert products into this SQLite catalog, e.g. catalog.db")
+    arg_parser.add_argument('--max-workers', type=int)
+    arg_parser.add_argument('--discovery', choices=['listing', 'sitemap', 'store_api'], default='listing', help="Where product URLs come from: the listing pages, the product sitemaps or the WooCommerce Store API")
+    arg_parser.add_argument('--sitemap', help="Sitemap index for --discovery sitemap (default: /sitemap_index.xml of the shop)")
+    arg_parser.add_argument('--parser', choices=list(PARSER_BACKENDS), default='bs4')
+    arg_parser.add_argument('--process-parsing', action='store_true', help="Parse pages in a pool of worker processes")
+    arg_parser.add_argument('--template-slicing', action='store_true', help="Cut the header, menus and footer shared by every page off before parsing")
+    arg_parser.add_argument('--jsonld', action='store_true', help="Read the fields the page's JSON-LD carries from it instead of the DOM")
+    arg_parser.add_argument('--cache-dir', help="Keep an HTTP cache here between runs, unchanged pages and images come back as 304s")
+    arg_parser.add_argument('--incremental-state', help="JSON file of the last run, only products whose listing tile changed are fetched")
+    arg_parser.add_argument('--variation-cache', help="JSON file keeping the variations fetched over AJAX between runs")
+    arg_parser.add_argument('--keep-raw-html', action='store_true', help="Don't strip Google Sheets attributes and other non-rendering markup from descriptions")
+    args = arg_parser.parse_args()
+
+    asyncio.run(crawl_wordpress_products(
+        args.shop_url,
+        max_workers=args.max_workers,
+        cache_dir=args.cache_dir,
+        incremental_state=args.incremental_state,
+        discovery=args.discovery,
+        sitemap_url=args.sitemap,
+        parser=args.parser,
+        process_parsing=args.process_parsing,
+        variation_cache_path=args.variation_cache,
+        sanitize_html=not args.keep_raw_html,
+        template_slicing=args.template_slicing,
+        jsonld_fast_path=args.jsonld,
+        outputs=args.outputs or ('products.csv', 'products.json'),
+        journal_path=args.journal,
+        resume=args.resume,
+        catalog_path=args.catalog,
+    ))
\ No newline at end of file
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import time
+from urllib.parse import urljoin
+
+import aiohttp
+
+from scheduler import request_slot
+
+GET_VARIATION_PATH = '/?wc-ajax=get_variation'
+
+# Attribute combinations resolved at once per product
+VARIATION_BATCH_SIZE = 8
+
+# Products with more combinations than this are only resolved up to it
+MAX_COMBINATIONS = 500
+
+# Cached variations of a product are asked for again after this long, even if its page looks unchanged
+VARIATION_CACHE_MAX_AGE = 7 * 24 * 3600
+
+
+def combination_key(combination):
+    """Stable cache key of an attribute combination ({'attribute_pa_mau': 'do', ...})."""
+    return '&'.join(f"{name}={value}" for name, value in sorted(combination.items()))
+
+
+def lookup_signature(lookup, base_price):
+    """Fingerprint of a product's attribute options and displayed price range, a change invalidates its cached variations."""
+    signature = json.dumps([lookup['attributes'], base_price, lookup.get('price_text', '')], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(signature.encode('utf-8')).hexdigest()
+
+
+def attribute_combinations(lookup):
+    """Every combination of the attribute options of a product, as POST fields for get_variation."""
+    select_names = [select_name for _, select_name, _ in lookup['attributes']]
+    option_values = [[value for value, _ in options] for _, _, options in lookup['attributes']]
+    for values in itertools.product(*option_values):
+        yield dict(zip(select_names, values))
+
+
+class VariationCache:
+    """get_variation results kept between runs, per product URL and attribute combination.
+
+    A product keeps its cached combinations as long as its attribute options
+    and displayed price range are unchanged, so a later run only asks for
+    new combinations. A price change inside the range doesn't show on the
+    page, so entries older than `max_age` seconds are fetched again anyway.
+    """
+
+    def __init__(self, cache_path='./variation_cache.json', max_age=VARIATION_CACHE_MAX_AGE):
+        self.cache_path = cache_path
+        self.max_age = max_age
+        self.products = {}
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as cache_file:
+                    self.products = json.load(cache_file)
+            except (OSError, json.JSONDecodeError) as err:
+                print(f"Ignoring unreadable variation cache {cache_path}: {err}")
+
+    def combinations(self, product_url, signature):
+        """The cached {combination_key: variation} of a product, emptied if its signature changed or it expired."""
+        entry = self.products.get(product_url)
+        if not entry or entry['signature'] != signature or time.time() - entry.get('fetched_at', 0) > self.max_age:
+            entry = self.products[product_url] = {'signature': signature, 'fetched_at': time.time(), 'combinations': {}}
+        return entry['combinations']
+
+    def save(self):
+        """Write the cache to disk atomically."""
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(self.products, cache_file, ensure_ascii=False)
+        os.replace(temp_path, self.cache_path)
+
+    def report(self):
+        print(f"Variation cache: {self.hits} combinations reused, {self.misses} fetched over AJAX")
+
+
+async def fetch_variation(ajax_url, product_id, combination, session, scheduler=None, retry=None, **fetch_options):
+    """Resolve one attribute combination through ?wc-ajax=get_variation.
+
+    Returns the variation (same keys as data-product_variations), None when
+    no variation matches the combination, or False when the request failed.
+    """
+    async def fetch_once():
+        async with request_slot(scheduler, 'html'):
+            request_start = time.time()
+            async with session.post(ajax_url, data={'product_id': product_id, **combination}) as response:
+                if scheduler:
+                    scheduler.record_response(response.status, time.time() - request_start)
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+    try:
+        variation = await (retry.run(ajax_url, fetch_once) if retry else fetch_once())
+    except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as err:
+        print(f"Error fetching variation {combination_key(combination)} of product {product_id}: {err or type(err).__name__}")
+        return False
+    return variation if isinstance(variation, dict) else None
+
+
+async def resolve_variations(product_url, lookup, session, base_price=0, variation_cache=None, **fetch_options):
+    """Resolve every attribute combination of a product over AJAX, in batches of VARIATION_BATCH_SIZE.
+
+    Returns the variations as a data-product_variations list. Combinations
+    already in `variation_cache` are not asked for again.
+    """
+    ajax_url = urljoin(product_url, GET_VARIATION_PATH)
+    combinations = list(itertools.islice(attribute_combinations(lookup), MAX_COMBINATIONS + 1))
+    if len(combinations) > MAX_COMBINATIONS:
+        print(f"{product_url} has more than {MAX_COMBINATIONS} variation combinations, only resolving the first {MAX_COMBINATIONS}")
+        combinations = combinations[:MAX_COMBINATIONS]
+
+    cached = variation_cache.combinations(product_url, lookup_signature(lookup, base_price)) if variation_cache else {}
+    missing = [combination for combination in combinations if combination_key(combination) not in cached]
+    if variation_cache:
+        variation_cache.hits += len(combinations) - len(missing)
+        variation_cache.misses += len(missing)
+
+    for batch_start in range(0, len(missing), VARIATION_BATCH_SIZE):
+        batch = missing[batch_start:batch_start + VARIATION_BATCH_SIZE]
+        results = await asyncio.gather(*(fetch_variation(ajax_url, lookup['product_id'], combination, session, **fetch_options) for combination in batch))
+        for combination, variation in zip(batch, results):
+            # Failed requests aren't cached, the next run asks again
+            if variation is not False:
+                cached[combination_key(combination)] = variation
+
+    variations = []
+    seen_ids = set()
+    for combination in combinations:
+        variation = cached.get(combination_key(combination))
+        # Combinations matching the same "any" variation resolve to it more than once
+        if variation and variation.get('variation_id') not in seen_ids:
+            seen_ids.add(variation.get('variation_id'))
+            variations.append(variation)
+    return variations
@@ -1,64 +1,75 @@
+import argparse
 import csv
 import json
-import re
+import os
 
-def convert_csv_to_json(csv_file_path, json_file_path):
-    # List to store the converted data
-    data = []
+from app.sinks import json_array_item, load_nested, to_int
 
-    # Read the CSV file
-    with open(csv_file_path, 'r', encoding='utf-8') as csv_file:
-        csv_reader = csv.DictReader(csv_file)
+# Fields of products.csv holding JSON that json.dumps put in a cell
+NESTED_FIELDS = ('variations', 'variation_matrix')
 
-        # Iterate through each row in the CSV
-        for row in csv_reader:
-            # Debug print for variations
-            print(f"Raw variations string: {row['variations']}")
-            
-            # Convert variations string to list of dictionaries
-            if row['variations']:
-                # Clean up the variations string to fix extra quotes
-                variations_str = row['variations'].replace("'", '"')  # Replace single quotes with double quotes
-                variations_str = variations_str.encode('utf-8').decode('unicode_escape')  # Handle unicode escape sequences
-                
-                # Remove any extraneous quotes from attribute_option_code
-                variations_str = re.sub(r'("attribute_option_code":\s*")([^"]*?)""', r'\1\2"', variations_str)
 
-                try:
-                    row['variations'] = json.loads(variations_str)
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON for variations: {e} - Variations string: {variations_str}")
-                    row['variations'] = []  # Default to empty list if JSON decoding fails
-            else:
-                row['variations'] = []
-            
-            # Convert price and special_price to integers
-            try:
-                row['price'] = int(float(row['price']))
-            except ValueError:
-                row['price'] = 0  # Default to 0 if conversion fails
+def convert_row(row):
+    """A products.csv row as a typed products.json record, and whether its nested fields all loaded."""
+    loaded = True
+    for field in NESTED_FIELDS:
+        if field not in row:
+            continue
+        if not row[field].strip():
+            row[field] = [] if field == 'variations' else None
+            continue
+        try:
+            row[field] = load_nested(row[field])
+        except ValueError:
+            loaded = False
+            row[field] = [] if field == 'variations' else None
+
+    for field in ('price', 'special_price', 'product_id'):
+        if field in row:
+            row[field] = to_int(row[field])
+    return row, loaded
+
 
-            try:
-                row['special_price'] = int(float(row['special_price']))
-            except ValueError:
-                row['special_price'] = 0  # Default to 0 if conversion fails
+def convert_csv_to_json(csv_file_path, json_file_path):
+    """Convert a legacy products.csv into products.json (or .jsonl), one row at a time.
+
+    The crawler writes products.json itself now, this is for CSVs of older
+    runs. Rows are streamed from the CSV to the output, so memory doesn't
+    grow with the file. The output is written atomically.
+    """
+    json_lines = json_file_path.lower().endswith('.jsonl')
+    temp_path = f"{json_file_path}.tmp"
+    converted = 0
+    unreadable = 0
+
+    csv.field_size_limit(2 ** 31 - 1)
+    with open(csv_file_path, 'r', newline='', encoding='utf-8') as csv_file, \
+            open(temp_path, 'w', encoding='utf-8') as json_file:
+        if not json_lines:
+            json_file.write('[')
+        for row in csv.DictReader(csv_file):
+            record, loaded = convert_row(row)
+            if not loaded:
+                unreadable += 1
+            if json_lines:
+                json_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            else:
+                # Same text as json.dump(records, indent=2), without holding the list
+                json_file.write(json_array_item(record, first=not converted))
+            converted += 1
+        if not json_lines:
+            json_file.write('\n]' if converted else ']')
+    os.replace(temp_path, json_file_path)
 
-            # Convert product_id to integer
-            try:
-                row['product_id'] = int(row['product_id'])
-            except ValueError:
-                row['product_id'] = 0  # Default to 0 if conversion fails
-            
-            # Append the processed row to the data list
-            data.append(row)
+    print(f"Converted {converted} products. JSON file saved as {json_file_path}")
+    if unreadable:
+        print(f"{unreadable} rows had variations that couldn't be read, they were left empty")
 
-    # Write the data to a JSON file
-    with open(json_file_path, 'w', encoding='utf-8') as json_file:
-        json.dump(data, json_file, ensure_ascii=False, indent=2)
 
-    print(f"Conversion complete. JSON file saved as {json_file_path}")
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Convert a products.csv of an older crawl to products.json or .jsonl.")
+    arg_parser.add_argument('csv_file', nargs='?', default='products.csv')
+    arg_parser.add_argument('json_file', nargs='?', default='products.json')
+    args = arg_parser.parse_args()
 
-# Usage
-csv_file_path = 'products.csv'
-json_file_path = 'products.json'
-convert_csv_to_json(csv_file_path, json_file_path)
+    convert_csv_to_json(args.csv_file, args.json_file)